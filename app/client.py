@@ -2,28 +2,167 @@
 
 from __future__ import annotations
 
+import asyncio
 import base64
+import logging
 import os
-from io import BytesIO
-from typing import List
+import shutil
+from typing import Any, Dict, List, Optional, Union
 
 import httpx
-from PIL import Image
 
+from .metrics import stage_timer
 from .models import CreateOutfitTaskRequest
 
 
+logger = logging.getLogger(__name__)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+_MEDIA_TYPE_FORMATS = {"image/png": "png", "image/webp": "webp", "image/jpeg": "jpeg"}
+_EXTENSIONS = {"png": "png", "webp": "webp", "jpeg": "jpg"}
+
+
+def _write_file(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _move_file(src: str, dst: str) -> None:
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    shutil.move(src, dst)
+
+
 class InferenceClient:
-    """Client for calling the inference service."""
+    """
+    Client for calling the inference service.
 
-    def __init__(self, base_url: str | None = None):
+    The client owns one long-lived httpx.AsyncClient so connections (and TLS
+    sessions) to the inference service are pooled and kept alive across tasks.
+    Call start() / aclose() from the application lifespan; if start() was not
+    called the pool is created lazily on first use.
+    """
+
+    def __init__(
+        self,
+        base_url: str | None = None,
+        max_connections: int | None = None,
+        max_keepalive_connections: int | None = None,
+        keepalive_expiry: float | None = None,
+        http2: bool | None = None,
+        connect_timeout: float | None = None,
+        infer_timeout: float | None = None,
+        bg_removal_timeout: float | None = None,
+        transport: str | None = None,
+        shared_dir: str | None = None,
+    ):
         """
         Initialize the inference client.
 
         Args:
             base_url: Base URL of the inference service. If None, reads from INFERENCE_SERVICE_URL env var.
+            max_connections: Pool size limit. If None, reads INFERENCE_MAX_CONNECTIONS.
+            max_keepalive_connections: Idle connections kept open. If None, reads INFERENCE_MAX_KEEPALIVE.
+            keepalive_expiry: Seconds an idle connection is kept. If None, reads INFERENCE_KEEPALIVE_EXPIRY.
+            http2: Whether to negotiate HTTP/2 (requires the h2 package). If None, reads INFERENCE_HTTP2.
+            connect_timeout: Connection timeout in seconds. If None, reads INFERENCE_CONNECT_TIMEOUT.
+            infer_timeout: Timeout for /infer calls. If None, reads INFERENCE_TIMEOUT.
+            bg_removal_timeout: Timeout for /remove_background calls. If None, reads BG_REMOVAL_TIMEOUT.
+            transport: How generated images come back: "binary" (raw bytes), "base64" (JSON) or
+                "shared" (written by the service into shared_dir). If None, reads INFERENCE_TRANSPORT.
+            shared_dir: Directory both services can access (a shared volume or /dev/shm) for the
+                "shared" transport. If None, reads INFERENCE_SHARED_DIR.
+
+        Raises:
+            ValueError: If a pool size or timeout is out of range, or the transport is unknown.
         """
         self.base_url = base_url or os.getenv("INFERENCE_SERVICE_URL", "http://localhost:8001")
+        if max_connections is None:
+            max_connections = int(os.getenv("INFERENCE_MAX_CONNECTIONS", "20"))
+        if max_keepalive_connections is None:
+            max_keepalive_connections = int(os.getenv("INFERENCE_MAX_KEEPALIVE", "10"))
+        if keepalive_expiry is None:
+            keepalive_expiry = float(os.getenv("INFERENCE_KEEPALIVE_EXPIRY", "30"))
+        if connect_timeout is None:
+            connect_timeout = float(os.getenv("INFERENCE_CONNECT_TIMEOUT", "10"))
+        if infer_timeout is None:
+            infer_timeout = float(os.getenv("INFERENCE_TIMEOUT", "300"))  # 5 minutes
+        if bg_removal_timeout is None:
+            bg_removal_timeout = float(os.getenv("BG_REMOVAL_TIMEOUT", "60"))
+        if max_connections < 1:
+            raise ValueError(f"max_connections must be at least 1, got {max_connections}")
+        # 0 keep-alive connections / expiry is valid: connections are simply not reused
+        if max_keepalive_connections < 0 or keepalive_expiry < 0:
+            raise ValueError(
+                f"Keep-alive settings must not be negative, got {max_keepalive_connections} and {keepalive_expiry}"
+            )
+        for name, value in (
+            ("connect_timeout", connect_timeout),
+            ("infer_timeout", infer_timeout),
+            ("bg_removal_timeout", bg_removal_timeout),
+        ):
+            if value <= 0:
+                raise ValueError(f"{name} must be positive, got {value}")
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 if http2 is not None else _env_bool("INFERENCE_HTTP2", False)
+        self.connect_timeout = connect_timeout
+        self.infer_timeout = infer_timeout
+        self.bg_removal_timeout = bg_removal_timeout
+        self.transport = transport or os.getenv("INFERENCE_TRANSPORT", "binary")
+        self.shared_dir = shared_dir or os.getenv("INFERENCE_SHARED_DIR")
+        if self.transport not in ("binary", "base64", "shared"):
+            raise ValueError(f"Unknown inference transport: {self.transport}")
+        if self.transport == "shared" and not self.shared_dir:
+            logger.warning("INFERENCE_TRANSPORT=shared requires INFERENCE_SHARED_DIR; using binary transport")
+            self.transport = "binary"
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        """Create the shared connection pool."""
+        if self._client is None:
+            self._client = self._create_client()
+
+    async def aclose(self) -> None:
+        """Close the shared connection pool."""
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    def _create_client(self) -> httpx.AsyncClient:
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("INFERENCE_HTTP2 is enabled but the h2 package is not installed; using HTTP/1.1")
+                http2 = False
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(self.infer_timeout, connect=self.connect_timeout),
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+
+    def _timeout(self, seconds: float) -> httpx.Timeout:
+        return httpx.Timeout(seconds, connect=self.connect_timeout)
 
     async def infer(
         self,
@@ -34,6 +173,10 @@ class InferenceClient:
         width: int = 1024,
         guidance_scale: float = 1.0,
         num_inference_steps: int = 10,
+        seed: int | None = None,
+        output_format: str | None = None,
+        output_quality: int | None = None,
+        profile: bool = False,
     ) -> str:
         """
         Call the inference service to generate an image.
@@ -46,6 +189,10 @@ class InferenceClient:
             width: Output image width
             guidance_scale: Guidance scale
             num_inference_steps: Number of inference steps
+            seed: Optional random seed for reproducible generation
+            output_format: Output encoding (png, webp or jpeg). If None, the service default is used.
+            output_quality: JPEG quality, or WebP quality when lossy
+            profile: Ask the service to store a profile of this generation under PROFILE_DIR/<task_id>
 
         Returns:
             Path to the generated image.
@@ -53,41 +200,147 @@ class InferenceClient:
         Raises:
             httpx.HTTPError: If the inference service call fails.
         """
-        # Prepare local output path (API layer handles saving)
-        os.makedirs("outputs", exist_ok=True)
-        output_path = os.path.join("outputs", f"{task_id}.png")
-
         # Prepare request
-        request_data = {
+        request_data = self.build_infer_request(
+            prompt=prompt,
+            image_paths=image_paths,
+            height=height,
+            width=width,
+            guidance_scale=guidance_scale,
+            num_inference_steps=num_inference_steps,
+            seed=seed,
+            output_format=output_format,
+            output_quality=output_quality,
+            profile=profile,
+        )
+        request_data["task_id"] = task_id
+        request_data.update(self._response_mode(task_id, allow_binary=True))
+
+        # Call inference service
+        client = self._get_client()
+        with stage_timer("inference_request"):
+            response = await client.post("/infer", json=request_data, timeout=self._timeout(self.infer_timeout))
+            response.raise_for_status()
+
+        with stage_timer("save_result"):
+            content_type = response.headers.get("content-type", "").split(";")[0].strip()
+            if content_type.startswith("image/"):
+                # Binary transport: the body is the encoded image, write it as-is
+                output_path = self._output_path(task_id, _MEDIA_TYPE_FORMATS.get(content_type, "png"))
+                await asyncio.to_thread(_write_file, output_path, response.content)
+                return output_path
+            return await self._save_inference_result(response.json(), task_id)
+
+    async def infer_batch(
+        self,
+        requests: List[Dict[str, Any]],
+        task_ids: List[str],
+    ) -> List[Union[str, Exception]]:
+        """
+        Call the inference service to generate several images in one request.
+
+        The service runs the items back-to-back on the warm model. A failing item
+        does not fail the others.
+
+        Args:
+            requests: Inference request bodies, e.g. from build_infer_request()
+            task_ids: Task ID per request, used for the output filenames
+
+        Returns:
+            Per item, the path to the generated image or the exception that item failed with.
+
+        Raises:
+            httpx.HTTPError: If the inference service call itself fails.
+        """
+        items = [
+            {**request_data, "task_id": task_id, **self._response_mode(task_id, allow_binary=False)}
+            for request_data, task_id in zip(requests, task_ids)
+        ]
+        client = self._get_client()
+        with stage_timer("inference_batch_request"):
+            response = await client.post(
+                "/infer_batch",
+                json={"items": items},
+                timeout=self._timeout(self.infer_timeout * len(items)),
+            )
+            response.raise_for_status()
+        results = response.json().get("results") or []
+        if len(results) != len(task_ids):
+            raise RuntimeError("Inference service returned a different number of batch results")
+
+        outputs: List[Union[str, Exception]] = []
+        for result, task_id in zip(results, task_ids):
+            try:
+                with stage_timer("save_result"):
+                    outputs.append(await self._save_inference_result(result, task_id))
+            except Exception as exc:  # noqa: BLE001
+                outputs.append(exc)
+        return outputs
+
+    @staticmethod
+    def build_infer_request(
+        prompt: str,
+        image_paths: List[str],
+        height: int = 1024,
+        width: int = 1024,
+        guidance_scale: float = 1.0,
+        num_inference_steps: int = 10,
+        seed: int | None = None,
+        output_format: str | None = None,
+        output_quality: int | None = None,
+        profile: bool = False,
+    ) -> Dict[str, Any]:
+        """Build the JSON body of an inference request."""
+        return {
             "prompt": prompt,
             "image_paths": image_paths,
             "height": height,
             "width": width,
             "guidance_scale": guidance_scale,
             "num_inference_steps": num_inference_steps,
+            "seed": seed,
+            "output_format": output_format,
+            "output_quality": output_quality,
+            "profile": profile,
         }
 
-        # Call inference service
-        async with httpx.AsyncClient(timeout=300.0) as client:  # 5 minute timeout for inference
-            response = await client.post(f"{self.base_url}/infer", json=request_data)
-            response.raise_for_status()
-            result = response.json()
-
-            if not result.get("success"):
-                error_msg = result.get("error_message", "Unknown error")
-                raise RuntimeError(f"Inference service error: {error_msg}")
-
-            image_base64 = result.get("image_base64")
-            if not image_base64:
-                raise RuntimeError("Inference service did not return image_base64")
+    def _response_mode(self, task_id: str, allow_binary: bool) -> Dict[str, Any]:
+        """Request fields selecting how the service returns the generated image."""
+        if self.transport == "shared":
+            # No extension: the service appends the one matching the output format
+            return {"response_mode": "file", "output_path": os.path.join(self.shared_dir, task_id)}
+        if self.transport == "binary" and allow_binary:
+            return {"response_mode": "binary"}
+        return {"response_mode": "base64"}
+
+    @staticmethod
+    def _output_path(task_id: str, image_format: str) -> str:
+        # Prepare local output path (API layer handles saving)
+        return os.path.join("outputs", f"{task_id}.{_EXTENSIONS.get(image_format, image_format)}")
+
+    @classmethod
+    async def _save_inference_result(cls, result: Dict[str, Any], task_id: str) -> str:
+        """Check a JSON inference response and place its image under outputs/ without re-encoding."""
+        if not result.get("success"):
+            error_msg = result.get("error_message", "Unknown error")
+            raise RuntimeError(f"Inference service error: {error_msg}")
+
+        output_path = cls._output_path(task_id, result.get("image_format") or "png")
+        shared_path = result.get("output_path")
+        if shared_path:
+            # Shared-volume handoff: the service already wrote the file
+            if os.path.abspath(shared_path) != os.path.abspath(output_path):
+                await asyncio.to_thread(_move_file, shared_path, output_path)
+            return output_path
 
-            # Decode base64 and save image locally
-            image_bytes = base64.b64decode(image_base64)
-            buffer = BytesIO(image_bytes)
-            image = Image.open(buffer).convert("RGB")
-            image.save(output_path, format="PNG")
+        image_base64 = result.get("image_base64")
+        if not image_base64:
+            raise RuntimeError("Inference service did not return image_base64")
 
-            return output_path
+        # Decode base64 and save image locally (off the event loop)
+        image_bytes = await asyncio.to_thread(base64.b64decode, image_base64)
+        await asyncio.to_thread(_write_file, output_path, image_bytes)
+        return output_path
 
     async def remove_background(
         self,
@@ -114,16 +367,72 @@ class InferenceClient:
         }
 
         # Call background removal service
-        async with httpx.AsyncClient(timeout=60.0) as client:  # 1 minute timeout for bg removal
-            response = await client.post(f"{self.base_url}/remove_background", json=request_data)
+        client = self._get_client()
+        with stage_timer("bg_removal_request"):
+            response = await client.post(
+                "/remove_background",
+                json=request_data,
+                timeout=self._timeout(self.bg_removal_timeout),
+            )
             response.raise_for_status()
-            result = response.json()
+        result = response.json()
 
-            if not result.get("success"):
-                error_msg = result.get("error_message", "Unknown error")
-                raise RuntimeError(f"Background removal service error: {error_msg}")
+        if not result.get("success"):
+            error_msg = result.get("error_message", "Unknown error")
+            raise RuntimeError(f"Background removal service error: {error_msg}")
+
+        return result.get("output_path") or output_path or image_path
+
+    async def remove_background_batch(
+        self,
+        images: List[Union[str, bytes]],
+        output_paths: Optional[List[Optional[str]]] = None,
+    ) -> List[Union[str, Exception]]:
+        """
+        Call the inference service to remove the background of several images in one request.
 
-            return result.get("output_path") or output_path or image_path
+        The service processes the items concurrently. A failing item does not fail the others.
+
+        Args:
+            images: Per item, a path or URL (str) or the encoded image itself (bytes)
+            output_paths: Optional output path per item. If None, the service generates them.
+
+        Returns:
+            Per item, the path to the image with background removed or the exception that item failed with.
+
+        Raises:
+            httpx.HTTPError: If the background removal service call itself fails.
+        """
+        if output_paths is None:
+            output_paths = [None] * len(images)
+        items = []
+        for image, output_path in zip(images, output_paths):
+            if isinstance(image, bytes):
+                encoded = await asyncio.to_thread(base64.b64encode, image)
+                items.append({"image_base64": encoded.decode("utf-8"), "output_path": output_path})
+            else:
+                items.append({"image_path": image, "output_path": output_path})
+
+        client = self._get_client()
+        with stage_timer("bg_removal_batch_request"):
+            response = await client.post(
+                "/remove_background_batch",
+                json={"items": items},
+                timeout=self._timeout(self.bg_removal_timeout * len(items)),
+            )
+            response.raise_for_status()
+        results = response.json().get("results") or []
+        if len(results) != len(items):
+            raise RuntimeError("Background removal service returned a different number of batch results")
+
+        outputs: List[Union[str, Exception]] = []
+        for result, output_path in zip(results, output_paths):
+            if result.get("success"):
+                outputs.append(result.get("output_path") or output_path)
+            else:
+                error_msg = result.get("error_message", "Unknown error")
+                outputs.append(RuntimeError(f"Background removal service error: {error_msg}"))
+        return outputs
 
     def collect_image_paths(self, req: CreateOutfitTaskRequest) -> List[str]:
         """
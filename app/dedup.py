@@ -0,0 +1,140 @@
+"""Deduplication of identical outfit tasks (result reuse and single-flight)."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+from .models import CreateOutfitTaskRequest
+
+
+def _hash_image_source(path_or_url: str) -> str:
+    """
+    Hash the content of a local image file.
+
+    Remote images are identified by their URL, since fetching them here would
+    cost more than the duplicate work we are trying to avoid.
+    """
+    parsed = urlparse(path_or_url)
+    if parsed.scheme in ("http", "https"):
+        return "url:" + path_or_url
+    digest = hashlib.sha256()
+    with open(path_or_url, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return "sha256:" + digest.hexdigest()
+
+
+async def compute_task_key(req: CreateOutfitTaskRequest, prompt: str) -> str:
+    """
+    Derive a deterministic key for an outfit task.
+
+    The key covers the built prompt, the content of every input image (and
+    whether its background is already removed), the generation parameters and
+    the seed, i.e. everything that determines the generated image. Only
+    meaningful for requests with an explicit seed: without one each run draws a
+    new random image.
+    """
+    images = [
+        ("person", req.person_image_path, req.person_bg_removed),
+        ("top", req.top_image_path, req.top_bg_removed),
+        ("pants", req.pants_image_path, req.pants_bg_removed),
+        ("shoes", req.shoes_image_path, req.shoes_bg_removed),
+        ("bag", req.bag_image_path, req.bag_bg_removed),
+    ]
+    images = [(name, path, bg_removed) for name, path, bg_removed in images if path]
+    # File hashing is blocking I/O; keep it off the event loop
+    hashes: List[str] = await asyncio.gather(
+        *(asyncio.to_thread(_hash_image_source, path) for _, path, _ in images)
+    )
+
+    material = {
+        "prompt": prompt,
+        "images": [
+            {"name": name, "content": content, "bg_removed": bg_removed}
+            for (name, _, bg_removed), content in zip(images, hashes)
+        ],
+        "params": {
+            "height": req.height,
+            "width": req.width,
+            "guidance_scale": req.guidance_scale,
+            "num_inference_steps": req.num_inference_steps,
+            "output_format": req.output_format,
+            "output_quality": req.output_quality,
+        },
+        "seed": req.seed,
+    }
+    encoded = json.dumps(material, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class TaskDeduplicator:
+    """
+    Bounded map from task keys (content keys or client idempotency keys) to task ids.
+
+    A hit means the caller should reuse the existing task: either its stored
+    result or, while it is still PENDING/RUNNING, the in-flight job itself.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None) -> None:
+        """
+        Initialize the deduplicator.
+
+        Args:
+            max_entries: Maximum remembered keys. If None, reads TASK_DEDUP_MAX_ENTRIES.
+
+        Raises:
+            ValueError: If max_entries is below 1.
+        """
+        if max_entries is None:
+            max_entries = int(os.getenv("TASK_DEDUP_MAX_ENTRIES", "10000"))
+        if max_entries < 1:
+            raise ValueError(f"TaskDeduplicator max_entries must be at least 1, got {max_entries}")
+        self.max_entries = max_entries
+        self._keys: "OrderedDict[str, str]" = OrderedDict()
+        # Task ids registered under a key whose TaskInfo is still being created
+        self._creating: Set[str] = set()
+        self._hits = 0
+
+    @staticmethod
+    def content_key(key: str) -> str:
+        return f"content:{key}"
+
+    @staticmethod
+    def idempotency_key(key: str) -> str:
+        return f"idempotency:{key}"
+
+    def lookup(self, key: str) -> Optional[str]:
+        task_id = self._keys.get(key)
+        if task_id is not None:
+            self._keys.move_to_end(key)
+        return task_id
+
+    def record_hit(self) -> None:
+        self._hits += 1
+
+    def remember(self, key: str, task_id: str) -> None:
+        self._keys[key] = task_id
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.max_entries:
+            self._keys.popitem(last=False)
+
+    def forget(self, key: str) -> None:
+        self._keys.pop(key, None)
+
+    def mark_creating(self, task_id: str) -> None:
+        self._creating.add(task_id)
+
+    def mark_created(self, task_id: str) -> None:
+        self._creating.discard(task_id)
+
+    def is_creating(self, task_id: str) -> bool:
+        return task_id in self._creating
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._keys), "hits": self._hits}
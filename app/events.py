@@ -0,0 +1,61 @@
+"""In-process notification of task status changes."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Dict
+
+
+class TaskNotifier:
+    """
+    Wakes coroutines waiting on a task when its status changes.
+
+    Each task with waiters has one asyncio.Event. notify() sets it and drops it,
+    so the next wait() starts on a fresh event. Events are removed as soon as
+    the last waiter leaves, so tasks nobody watches cost nothing.
+    """
+
+    def __init__(self) -> None:
+        self._events: Dict[str, asyncio.Event] = {}
+        self._waiters: Dict[str, int] = {}
+
+    def prepare(self, task_id: str) -> asyncio.Event:
+        """
+        Register interest in task_id before reading its current state.
+
+        Grabbing the event first means a change landing between the read and
+        the wait still wakes the waiter.
+        """
+        event = self._events.get(task_id)
+        if event is None:
+            event = asyncio.Event()
+            self._events[task_id] = event
+        self._waiters[task_id] = self._waiters.get(task_id, 0) + 1
+        return event
+
+    @staticmethod
+    async def wait(event: asyncio.Event, timeout: float) -> bool:
+        """Wait for a prepared event. Returns True if notified, False on timeout."""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def release(self, task_id: str) -> None:
+        """Undo prepare(); must be called once per prepare()."""
+        remaining = self._waiters.get(task_id, 1) - 1
+        if remaining > 0:
+            self._waiters[task_id] = remaining
+            return
+        # Nobody is waiting on this task any more, whichever event is current
+        self._waiters.pop(task_id, None)
+        self._events.pop(task_id, None)
+
+    def notify(self, task_id: str) -> None:
+        event = self._events.pop(task_id, None)
+        if event is not None:
+            event.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {"watched_tasks": len(self._events), "waiters": sum(self._waiters.values())}
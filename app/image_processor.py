@@ -2,65 +2,93 @@
 
 from __future__ import annotations
 
+import asyncio
 import os
-from typing import List
+import time
+from typing import Dict, List, Optional, Tuple
 
 from .client import InferenceClient
+from .metrics import observe_stage
 from .models import CreateOutfitTaskRequest
 
 
+def _collect_images(req: CreateOutfitTaskRequest) -> List[Tuple[str, str, bool]]:
+    """
+    Collect (name, image_path, bg_removed) for the person image and at most three accessories.
+
+    The order matches the inference contract: [person, accessory1, accessory2, accessory3].
+    """
+    images: List[Tuple[str, str, bool]] = [("person", req.person_image_path, req.person_bg_removed)]
+
+    accessories = [
+        (req.top_image_path, req.top_bg_removed, "top"),
+        (req.pants_image_path, req.pants_bg_removed, "pants"),
+        (req.shoes_image_path, req.shoes_bg_removed, "shoes"),
+        (req.bag_image_path, req.bag_bg_removed, "bag"),
+    ]
+
+    accessory_count = 0
+    for image_path, bg_removed, name in accessories:
+        if image_path and accessory_count < 3:  # At most 3 accessories
+            images.append((name, image_path, bg_removed))
+            accessory_count += 1
+
+    return images
+
+
 async def process_images_for_inference(
     req: CreateOutfitTaskRequest,
     task_id: str,
     inference_client: InferenceClient,
+    max_concurrency: Optional[int] = None,
+    timings: Optional[Dict[str, float]] = None,
 ) -> List[str]:
     """
     Process images for inference: remove background if needed via inference service.
 
+    Background removal for all images of the task runs concurrently, capped at
+    max_concurrency in-flight calls per task.
+
     Args:
         req: The outfit task request
         task_id: Task ID for generating output paths
         inference_client: Client for calling inference service
+        max_concurrency: Per-task cap on concurrent removals. If None, reads BG_REMOVAL_CONCURRENCY.
+        timings: Optional dict filled with per-image removal time in seconds, keyed by image name.
 
     Returns:
         List of processed image paths in order: [person_image, accessory1, accessory2, accessory3]
+
+    Raises:
+        ValueError: If max_concurrency is below 1.
     """
-    processed_paths: List[str] = []
     output_dir = os.path.join("outputs", "bg_removed", task_id)
     os.makedirs(output_dir, exist_ok=True)
 
-    # Process person image
-    if req.person_bg_removed:
-        processed_paths.append(req.person_image_path)
-    else:
-        output_path = os.path.join(output_dir, "person.png")
-        processed_path = await inference_client.remove_background(
-            image_path=req.person_image_path,
-            output_path=output_path,
-        )
-        processed_paths.append(processed_path)
-
-    # Process accessory images
-    accessories = [
-        (req.top_image_path, req.top_bg_removed, "top"),
-        (req.pants_image_path, req.pants_bg_removed, "pants"),
-        (req.shoes_image_path, req.shoes_bg_removed, "shoes"),
-        (req.bag_image_path, req.bag_bg_removed, "bag"),
-    ]
-
-    accessory_count = 0
-    for image_path, bg_removed, name in accessories:
-        if image_path and accessory_count < 3:  # At most 3 accessories
-            if bg_removed:
-                processed_paths.append(image_path)
-            else:
-                output_path = os.path.join(output_dir, f"{name}.png")
-                processed_path = await inference_client.remove_background(
-                    image_path=image_path,
-                    output_path=output_path,
-                )
-                processed_paths.append(processed_path)
-            accessory_count += 1
+    limit = max_concurrency
+    if limit is None:
+        limit = int(os.getenv("BG_REMOVAL_CONCURRENCY", "4"))
+    if limit < 1:
+        raise ValueError(f"max_concurrency must be at least 1, got {limit}")
+    semaphore = asyncio.Semaphore(limit)
 
-    return processed_paths
+    async def _process(name: str, image_path: str, bg_removed: bool) -> str:
+        if bg_removed:
+            return image_path
+        async with semaphore:
+            start = time.perf_counter()
+            processed_path = await inference_client.remove_background(
+                image_path=image_path,
+                output_path=os.path.join(output_dir, f"{name}.png"),
+            )
+            elapsed = time.perf_counter() - start
+            observe_stage("bg_removal", elapsed)
+            if timings is not None:
+                timings[name] = elapsed
+            return processed_path
 
+    # gather preserves argument order, so the result keeps the [person, acc1, acc2, acc3] contract
+    processed_paths = await asyncio.gather(
+        *(_process(name, image_path, bg_removed) for name, image_path, bg_removed in _collect_images(req))
+    )
+    return list(processed_paths)
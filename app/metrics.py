@@ -0,0 +1,52 @@
+"""Prometheus metrics for the API: per-stage latency histograms and scrape-time gauges."""
+
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+
+# Covers both sub-10ms stages (prompt building, file writes) and multi-minute inference calls
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+STAGE_SECONDS = Histogram(
+    "ootd_api_stage_seconds",
+    "Time spent in each task processing stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+TASKS_FINISHED = Counter("ootd_api_tasks_finished_total", "Tasks that reached a final status", ["status"])
+COMPONENT_STATS = Gauge(
+    "ootd_api_component_stats",
+    "Snapshot of the /api/v1/stats counters (queue depth, store size, dedup hits, ...)",
+    ["component", "field"],
+)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Time the enclosed block as one observation of stage (also when it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def render(stats: Dict[str, Dict[str, Any]]) -> bytes:
+    """Refresh the component gauges from stats() snapshots and return the exposition text."""
+    for component, values in stats.items():
+        for field, value in values.items():
+            if isinstance(value, (int, float)):
+                COMPONENT_STATS.labels(component, field).set(value)
+    return generate_latest()
+
+
+__all__ = ["CONTENT_TYPE_LATEST", "TASKS_FINISHED", "observe_stage", "render", "stage_timer"]
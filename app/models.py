@@ -10,6 +10,8 @@ PartType = Literal["TOP", "PANTS", "SHOES", "BAG"]
 
 TaskStatus = Literal["PENDING", "RUNNING", "SUCCEEDED", "FAILED"]
 
+OutputFormat = Literal["png", "webp", "jpeg"]
+
 
 class CreateOutfitTaskRequest(BaseModel):
     """
@@ -61,6 +63,27 @@ class CreateOutfitTaskRequest(BaseModel):
         "If False, only replace the provided accessories without constraints on other parts.",
     )
 
+    height: int = Field(default=1024, description="Output image height")
+    width: int = Field(default=1024, description="Output image width")
+    guidance_scale: float = Field(default=1.0, description="Guidance scale for generation")
+    num_inference_steps: int = Field(default=10, description="Number of inference steps")
+    seed: Optional[int] = Field(
+        default=None,
+        description="Optional random seed. Identical outfits with the same seed are deduplicated; "
+        "pass a different seed to get a new variant.",
+    )
+    output_format: Optional[OutputFormat] = Field(
+        default=None, description="Output encoding (png, webp or jpeg). If None, uses the deployment default."
+    )
+    output_quality: Optional[int] = Field(
+        default=None, ge=0, le=100, description="JPEG quality, or WebP quality when lossy"
+    )
+    profile: bool = Field(
+        default=False,
+        description="Have the inference service store a profile of this generation under PROFILE_DIR/<task_id>. "
+        "Profiled tasks always run, bypassing result deduplication.",
+    )
+
     @root_validator(skip_on_failure=True)
     def validate_image_count(cls, values: Dict) -> Dict:
         """Ensure person_image_path is provided and at most three accessory images."""
@@ -78,12 +101,88 @@ class CreateOutfitTaskRequest(BaseModel):
         return values
 
 
+class OutfitVariant(BaseModel):
+    """One outfit combination of a batch; the person image is shared across variants."""
+
+    top_image_path: Optional[str] = Field(default=None, description="Top/clothing image (local path or URL)")
+    top_bg_removed: bool = Field(default=False, description="Whether the top image already has background removed")
+    pants_image_path: Optional[str] = Field(default=None, description="Pants image (local path or URL)")
+    pants_bg_removed: bool = Field(
+        default=False, description="Whether the pants image already has background removed"
+    )
+    shoes_image_path: Optional[str] = Field(default=None, description="Shoes image (local path or URL)")
+    shoes_bg_removed: bool = Field(
+        default=False, description="Whether the shoes image already has background removed"
+    )
+    bag_image_path: Optional[str] = Field(default=None, description="Bag image (local path or URL)")
+    bag_bg_removed: bool = Field(default=False, description="Whether the bag image already has background removed")
+
+    top_desc: Optional[str] = Field(default=None, description="Optional textual description of the top.")
+    pants_desc: Optional[str] = Field(default=None, description="Optional textual description of the pants.")
+    shoes_desc: Optional[str] = Field(default=None, description="Optional textual description of the shoes.")
+    bag_desc: Optional[str] = Field(default=None, description="Optional textual description of the bag.")
+
+
+class CreateOutfitBatchRequest(BaseModel):
+    """
+    Request body for generating several outfit variants for one person.
+
+    The person image background is removed once and shared by all variants;
+    every variant becomes its own task with the same generation parameters.
+    """
+
+    person_image_path: str = Field(..., description="Required: Base person/model image (local path or URL)")
+    person_bg_removed: bool = Field(
+        default=False, description="Whether the person image already has background removed"
+    )
+    variants: List[OutfitVariant] = Field(
+        ..., description="Outfit combinations to generate", min_items=1, max_items=16
+    )
+
+    style_tags: Optional[List[str]] = Field(
+        default=None,
+        description="Optional style or scenario tags applied to every variant",
+    )
+    keep_original: bool = Field(
+        default=False,
+        description="If True, keep non-provided clothing parts unchanged from the original image.",
+    )
+
+    height: int = Field(default=1024, description="Output image height")
+    width: int = Field(default=1024, description="Output image width")
+    guidance_scale: float = Field(default=1.0, description="Guidance scale for generation")
+    num_inference_steps: int = Field(default=10, description="Number of inference steps")
+    seed: Optional[int] = Field(default=None, description="Optional random seed applied to every variant")
+    output_format: Optional[OutputFormat] = Field(
+        default=None, description="Output encoding (png, webp or jpeg). If None, uses the deployment default."
+    )
+    output_quality: Optional[int] = Field(
+        default=None, ge=0, le=100, description="JPEG quality, or WebP quality when lossy"
+    )
+    profile: bool = Field(
+        default=False,
+        description="Have the inference service store a profile of every variant under PROFILE_DIR/<task_id>",
+    )
+
+    def to_task_requests(self) -> List[CreateOutfitTaskRequest]:
+        """Expand the batch into one CreateOutfitTaskRequest per variant (validators included)."""
+        shared = self.dict(exclude={"variants"})
+        return [CreateOutfitTaskRequest(**shared, **variant.dict()) for variant in self.variants]
+
+
+class CreateOutfitBatchResponse(BaseModel):
+    batch_id: str
+    task_ids: List[str]
+    status: TaskStatus
+
+
 class TaskInfo(BaseModel):
     task_id: str
     status: TaskStatus
     created_at: datetime
     updated_at: datetime
-    input: CreateOutfitTaskRequest
+    # Dropped once the task finishes to keep completed records small
+    input: Optional[CreateOutfitTaskRequest] = None
     result: Optional[Dict] = None
     error_message: Optional[str] = None
 
@@ -0,0 +1,117 @@
+"""Serving helpers for generated images: strong ETags and lazily built size derivatives."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import uuid
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from PIL import Image
+
+
+MEDIA_TYPES: Dict[str, str] = {".png": "image/png", ".webp": "image/webp", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
+
+# Immutable: a task's image never changes once written, so clients and CDNs may cache it forever
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _parse_sizes(value: str) -> Tuple[int, ...]:
+    return tuple(sorted(int(size) for size in value.split(",") if size.strip()))
+
+
+class ResultImageServer:
+    """
+    Computes ETags for result images and builds size-bucketed derivatives on demand.
+
+    Derivatives (longest side at most one of the configured sizes) are generated
+    on first request in a worker thread and cached on disk next to the outputs.
+    """
+
+    def __init__(self, derived_dir: str | None = None, sizes: Tuple[int, ...] | None = None) -> None:
+        """
+        Initialize the server.
+
+        Args:
+            derived_dir: Where derivatives are cached. If None, reads RESULT_DERIVED_DIR.
+            sizes: Allowed derivative sizes in pixels. If None, reads RESULT_THUMBNAIL_SIZES.
+        """
+        self.derived_dir = derived_dir or os.getenv("RESULT_DERIVED_DIR", os.path.join("outputs", "derived"))
+        self.sizes = sizes or _parse_sizes(os.getenv("RESULT_THUMBNAIL_SIZES", "256,512"))
+        self._etags: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._max_etags = 10000
+        self._building: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def media_type(path: str) -> str:
+        return MEDIA_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+
+    async def etag(self, path: str, stat_result: os.stat_result) -> str:
+        """Strong ETag from the file content hash, cached per (path, mtime, size)."""
+        key = (path, stat_result.st_mtime_ns, stat_result.st_size)
+        etag = self._etags.get(key)
+        if etag is None:
+            etag = f'"{await asyncio.to_thread(_hash_file, path)}"'
+            self._etags[key] = etag
+            while len(self._etags) > self._max_etags:
+                self._etags.popitem(last=False)
+        else:
+            self._etags.move_to_end(key)
+        return etag
+
+    async def derivative(self, source_path: str, size: int) -> str:
+        """
+        Return the path of the source image scaled to fit size x size, building it if needed.
+
+        Raises:
+            ValueError: If size is not one of the configured sizes.
+        """
+        if size not in self.sizes:
+            raise ValueError(f"Unsupported size {size}; choose one of {', '.join(map(str, self.sizes))}")
+
+        name, ext = os.path.splitext(os.path.basename(source_path))
+        derived_path = os.path.join(self.derived_dir, f"{name}_{size}{ext}")
+        if os.path.exists(derived_path):
+            return derived_path
+
+        # Coalesce concurrent first requests for the same derivative. The build runs as its own
+        # task, so a requester that disconnects does not cancel it for the others still waiting.
+        build = self._building.get(derived_path)
+        if build is None:
+            build = asyncio.ensure_future(asyncio.to_thread(_build_derivative, source_path, derived_path, size))
+            self._building[derived_path] = build
+            build.add_done_callback(lambda done: self._finish_build(derived_path, done))
+        await asyncio.shield(build)
+        return derived_path
+
+    def _finish_build(self, derived_path: str, build: asyncio.Future) -> None:
+        self._building.pop(derived_path, None)
+        if not build.cancelled():
+            # Mark retrieved so a failure nobody waited on is not reported as unhandled
+            build.exception()
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _build_derivative(source_path: str, derived_path: str, size: int) -> None:
+    os.makedirs(os.path.dirname(derived_path), exist_ok=True)
+    with Image.open(source_path) as image:
+        image_format = image.format
+        # draft() lets JPEG decode straight at a reduced scale
+        image.draft(image.mode, (size, size))
+        image.thumbnail((size, size), Image.LANCZOS)
+        # Unique per writer: several API worker processes may build the same derivative at once
+        tmp_path = f"{derived_path}.{uuid.uuid4().hex}.tmp"
+        if image_format == "JPEG":
+            image.save(tmp_path, format="JPEG", quality=85)
+        else:
+            image.save(tmp_path, format=image_format)
+    os.replace(tmp_path, derived_path)
@@ -0,0 +1,346 @@
+"""Durable SQLite task store for multi-worker API deployments on one host."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from .models import CreateOutfitTaskRequest, TaskInfo, TaskStatus
+from .store import FINISHED_STATUSES
+
+
+T = TypeVar("T")
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS tasks (
+        task_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        input TEXT,
+        result TEXT,
+        error_message TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status)",
+    "CREATE INDEX IF NOT EXISTS idx_tasks_updated_at ON tasks (updated_at)",
+)
+
+_UPSERT_SQL = """
+    INSERT INTO tasks (task_id, status, created_at, updated_at, input, result, error_message)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (task_id) DO UPDATE SET
+        status = excluded.status,
+        updated_at = excluded.updated_at,
+        input = excluded.input,
+        result = excluded.result,
+        error_message = excluded.error_message
+"""
+
+# Finished tasks drop their request, matching the compact records of InMemoryTaskStore
+_UPDATE_STATUS_SQL = """
+    UPDATE tasks SET
+        status = ?,
+        updated_at = ?,
+        result = COALESCE(?, result),
+        error_message = COALESCE(?, error_message),
+        input = CASE WHEN ? THEN NULL ELSE input END
+    WHERE task_id = ?
+"""
+
+_CLAIM_SQL = "UPDATE tasks SET status = 'RUNNING', updated_at = ? WHERE task_id = ? AND status = 'PENDING'"
+
+_FAIL_STALE_SQL = """
+    UPDATE tasks SET status = 'FAILED', updated_at = ?, error_message = ?, input = NULL
+    WHERE task_id = ? AND status = 'RUNNING' AND updated_at < ?
+"""
+
+_EXPIRE_SQL = "DELETE FROM tasks WHERE status IN ('SUCCEEDED', 'FAILED') AND updated_at < ?"
+
+Statement = Tuple[str, Sequence[Any]]
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def _row_to_task(row: Tuple[Any, ...]) -> TaskInfo:
+    task_id, status, created_at, updated_at, input_json, result_json, error_message = row
+    return TaskInfo(
+        task_id=task_id,
+        status=status,
+        created_at=datetime.fromisoformat(created_at),
+        updated_at=datetime.fromisoformat(updated_at),
+        input=CreateOutfitTaskRequest.parse_raw(input_json) if input_json else None,
+        result=json.loads(result_json) if result_json else None,
+        error_message=error_message,
+    )
+
+
+class SQLiteTaskStore:
+    """
+    Task store backed by a SQLite database in WAL mode.
+
+    Several API worker processes on the same host can share one database file,
+    and queued tasks survive restarts. Reads go through a small pool of
+    connections on worker threads. Writes are funneled through a single writer
+    that commits everything queued within batch_window seconds in one
+    transaction, so bursts of status updates cost one fsync instead of many.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        pool_size: Optional[int] = None,
+        batch_window: Optional[float] = None,
+        max_batch: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+    ) -> None:
+        """
+        Initialize the store.
+
+        Args:
+            path: Database file. If None, reads TASK_STORE_PATH.
+            pool_size: Number of pooled read connections. If None, reads TASK_STORE_POOL_SIZE.
+            batch_window: Seconds the writer waits to gather more writes. If None, reads TASK_STORE_BATCH_WINDOW.
+            max_batch: Maximum writes per transaction. If None, reads TASK_STORE_MAX_BATCH.
+            ttl_seconds: How long finished tasks are kept. If None, reads TASK_STORE_TTL.
+
+        Raises:
+            ValueError: If pool_size or max_batch is below 1, batch_window is negative or
+                ttl_seconds is not positive.
+        """
+        self.path = path or os.getenv("TASK_STORE_PATH", os.path.join("outputs", "tasks.db"))
+        if pool_size is None:
+            pool_size = int(os.getenv("TASK_STORE_POOL_SIZE", "4"))
+        if batch_window is None:
+            batch_window = float(os.getenv("TASK_STORE_BATCH_WINDOW", "0.002"))
+        if max_batch is None:
+            max_batch = int(os.getenv("TASK_STORE_MAX_BATCH", "256"))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("TASK_STORE_TTL", "3600"))
+        for name, value, minimum in (
+            ("pool_size", pool_size, 1),
+            ("max_batch", max_batch, 1),
+            ("batch_window", batch_window, 0),
+        ):
+            if value < minimum:
+                raise ValueError(f"SQLiteTaskStore {name} must be at least {minimum}, got {value}")
+        if ttl_seconds <= 0:
+            raise ValueError(f"SQLiteTaskStore ttl_seconds must be positive, got {ttl_seconds}")
+        self.pool_size = pool_size
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.ttl_seconds = ttl_seconds
+
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._writer_conn: Optional[sqlite3.Connection] = None
+        self._writes: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._next_expiry = 0.0
+        self._batches = 0
+        self._writes_committed = 0
+        self._evicted_ttl = 0
+
+    async def start(self) -> None:
+        """Open the connections, create the schema and start the batch writer."""
+        if self._writer_task is not None:
+            return
+        await asyncio.to_thread(self._open)
+        self._writes = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer(), name="sqlite-task-store-writer")
+
+    async def close(self) -> None:
+        """Flush pending writes and close all connections."""
+        if self._writer_task is None:
+            return
+        assert self._writes is not None
+        await self._writes.join()
+        self._writer_task.cancel()
+        await asyncio.gather(self._writer_task, return_exceptions=True)
+        self._writer_task = None
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        if self._writer_conn is not None:
+            self._writer_conn.close()
+            self._writer_conn = None
+
+    async def get_task(self, task_id: str) -> Optional[TaskInfo]:
+        row = await self._read(
+            lambda conn: conn.execute(
+                "SELECT task_id, status, created_at, updated_at, input, result, error_message "
+                "FROM tasks WHERE task_id = ?",
+                (task_id,),
+            ).fetchone()
+        )
+        return _row_to_task(row) if row is not None else None
+
+    async def upsert_task(self, task: TaskInfo) -> None:
+        await self._write(
+            _UPSERT_SQL,
+            (
+                task.task_id,
+                task.status,
+                task.created_at.isoformat(),
+                task.updated_at.isoformat(),
+                task.input.json() if task.input is not None else None,
+                json.dumps(task.result) if task.result is not None else None,
+                task.error_message,
+            ),
+        )
+
+    async def update_status(
+        self,
+        task_id: str,
+        status: TaskStatus,
+        result: Optional[Dict] = None,
+        error_message: Optional[str] = None,
+    ) -> None:
+        await self._write(
+            _UPDATE_STATUS_SQL,
+            (
+                status,
+                datetime.utcnow().isoformat(),
+                json.dumps(result) if result is not None else None,
+                error_message,
+                status in FINISHED_STATUSES,
+                task_id,
+            ),
+        )
+
+    async def claim_task(self, task_id: str) -> bool:
+        """Move a PENDING task to RUNNING. Returns False if it is missing or another worker claimed it."""
+        return await self._write(_CLAIM_SQL, (datetime.utcnow().isoformat(), task_id)) == 1
+
+    async def fail_if_stale(self, task_id: str, updated_before: datetime, error_message: str) -> bool:
+        """Move a RUNNING task last updated before updated_before to FAILED. Returns whether it did."""
+        params = (datetime.utcnow().isoformat(), error_message, task_id, updated_before.isoformat())
+        return await self._write(_FAIL_STALE_SQL, params) == 1
+
+    async def touch_tasks(self, task_ids: List[str]) -> None:
+        """Refresh updated_at of the given tasks that are still RUNNING (the owner's heartbeat)."""
+        placeholders = ", ".join("?" for _ in task_ids)
+        await self._write(
+            f"UPDATE tasks SET updated_at = ? WHERE status = 'RUNNING' AND task_id IN ({placeholders})",
+            (datetime.utcnow().isoformat(), *task_ids),
+        )
+
+    async def list_task_ids(self, status: TaskStatus) -> List[str]:
+        rows = await self._read(
+            lambda conn: conn.execute(
+                "SELECT task_id FROM tasks WHERE status = ? ORDER BY created_at", (status,)
+            ).fetchall()
+        )
+        return [row[0] for row in rows]
+
+    async def stats(self) -> Dict[str, int]:
+        size = await self._read(lambda conn: conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0])
+        return {
+            "size": size,
+            "pending_writes": self._writes.qsize() if self._writes is not None else 0,
+            "write_batches": self._batches,
+            "writes_committed": self._writes_committed,
+            "evicted_ttl": self._evicted_ttl,
+        }
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._writer_conn = _connect(self.path)
+        for statement in _SCHEMA:
+            self._writer_conn.execute(statement)
+        for _ in range(self.pool_size):
+            self._readers.put(_connect(self.path))
+
+    async def _read(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        def run() -> T:
+            conn = self._readers.get()
+            try:
+                return fn(conn)
+            finally:
+                self._readers.put(conn)
+
+        return await asyncio.to_thread(run)
+
+    async def _write(self, sql: str, params: Sequence[Any]) -> int:
+        """Queue a statement for the batch writer and wait until it is committed. Returns the rowcount."""
+        if self._writes is None:
+            raise RuntimeError("SQLiteTaskStore.start() must be called before writing")
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        await self._writes.put(((sql, params), future))
+        return await future
+
+    async def _writer(self) -> None:
+        assert self._writes is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._writes.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                if not self._writes.empty():
+                    batch.append(self._writes.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._writes.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            statements = [statement for statement, _ in batch]
+            expire_before = None
+            if time.monotonic() >= self._next_expiry:
+                self._next_expiry = time.monotonic() + 60.0
+                expire_before = (datetime.utcnow() - timedelta(seconds=self.ttl_seconds)).isoformat()
+
+            try:
+                outcomes = await asyncio.to_thread(self._execute_batch, statements, expire_before)
+            except Exception as exc:  # noqa: BLE001
+                outcomes = [exc] * len(batch)
+
+            for (_, future), outcome in zip(batch, outcomes):
+                if not future.done():
+                    if isinstance(outcome, Exception):
+                        future.set_exception(outcome)
+                    else:
+                        future.set_result(outcome)
+                self._writes.task_done()
+
+    def _execute_batch(self, statements: List[Statement], expire_before: Optional[str]) -> List[Any]:
+        """Run statements in one transaction; on failure, retry each on its own so one bad write fails alone."""
+        conn = self._writer_conn
+        assert conn is not None
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rowcounts = [conn.execute(sql, params).rowcount for sql, params in statements]
+            if expire_before is not None:
+                self._evicted_ttl += conn.execute(_EXPIRE_SQL, (expire_before,)).rowcount
+            conn.execute("COMMIT")
+            self._batches += 1
+            self._writes_committed += len(statements)
+            return rowcounts
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+
+        outcomes: List[Any] = []
+        for sql, params in statements:
+            try:
+                outcomes.append(conn.execute(sql, params).rowcount)
+                self._writes_committed += 1
+            except sqlite3.Error as exc:
+                outcomes.append(exc)
+        return outcomes
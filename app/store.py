@@ -1,32 +1,109 @@
 from __future__ import annotations
 
 import asyncio
-from datetime import datetime
-from typing import Dict, Optional
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Protocol, Set
 
+from .events import TaskNotifier
+from .metrics import TASKS_FINISHED
 from .models import CreateOutfitTaskRequest, TaskInfo, TaskStatus
 
 
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("SUCCEEDED", "FAILED")
+
+STALE_TASK_ERROR = "Interrupted: the API worker processing this task stopped before it finished"
+
+
+class TaskStore(Protocol):
+    """Interface shared by the task store backends."""
+
+    async def start(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+    async def get_task(self, task_id: str) -> Optional[TaskInfo]: ...
+
+    async def upsert_task(self, task: TaskInfo) -> None: ...
+
+    async def update_status(
+        self,
+        task_id: str,
+        status: TaskStatus,
+        result: Optional[Dict] = None,
+        error_message: Optional[str] = None,
+    ) -> None: ...
+
+    async def claim_task(self, task_id: str) -> bool: ...
+
+    async def fail_if_stale(self, task_id: str, updated_before: datetime, error_message: str) -> bool: ...
+
+    async def touch_tasks(self, task_ids: List[str]) -> None: ...
+
+    async def list_task_ids(self, status: TaskStatus) -> List[str]: ...
+
+    async def stats(self) -> Dict[str, int]: ...
+
+
 class InMemoryTaskStore:
     """
     Simple in-memory task store.
 
     This is suitable for local development and can later be replaced
     by a Redis-backed implementation with the same interface.
+
+    Finished tasks are kept in a compact form (without the original request)
+    and evicted after ttl_seconds, or earlier, oldest first, once the store
+    holds more than max_entries tasks. Pending and running tasks are never evicted.
+
+    No lock is needed: every read and write below runs to completion without
+    awaiting, so it is atomic with respect to other coroutines on the event loop.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None) -> None:
+        """
+        Initialize the store.
+
+        Args:
+            ttl_seconds: How long finished tasks are kept. If None, reads TASK_STORE_TTL.
+            max_entries: Soft cap on stored tasks. If None, reads TASK_STORE_MAX_ENTRIES.
+
+        Raises:
+            ValueError: If ttl_seconds is not positive or max_entries is below 1.
+        """
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("TASK_STORE_TTL", "3600"))
+        if max_entries is None:
+            max_entries = int(os.getenv("TASK_STORE_MAX_ENTRIES", "10000"))
+        if ttl_seconds <= 0 or max_entries < 1:
+            raise ValueError(
+                f"InMemoryTaskStore needs ttl_seconds > 0 and max_entries >= 1, got {ttl_seconds} and {max_entries}"
+            )
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
         self._tasks: Dict[str, TaskInfo] = {}
-        # Protect concurrent access in async context
-        self._lock = asyncio.Lock()
+        # Finished task ids in completion order -> monotonic finish time
+        self._finished: "OrderedDict[str, float]" = OrderedDict()
+        self._evicted_ttl = 0
+        self._evicted_capacity = 0
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
 
     async def get_task(self, task_id: str) -> Optional[TaskInfo]:
-        async with self._lock:
-            return self._tasks.get(task_id)
+        return self._tasks.get(task_id)
 
     async def upsert_task(self, task: TaskInfo) -> None:
-        async with self._lock:
-            self._tasks[task.task_id] = task
+        self._tasks[task.task_id] = task
+        self._evict()
 
     async def update_status(
         self,
@@ -35,26 +112,145 @@ class InMemoryTaskStore:
         result: Optional[Dict] = None,
         error_message: Optional[str] = None,
     ) -> None:
-        async with self._lock:
+        task = self._tasks.get(task_id)
+        if task is None:
+            return
+        task.status = status
+        task.updated_at = datetime.utcnow()
+        if result is not None:
+            task.result = result
+        if error_message is not None:
+            task.error_message = error_message
+        if status in FINISHED_STATUSES:
+            # The request is only needed while the task is being processed
+            task.input = None
+            self._finished[task_id] = time.monotonic()
+        self._tasks[task_id] = task
+        self._evict()
+
+    async def claim_task(self, task_id: str) -> bool:
+        """Move a PENDING task to RUNNING. Returns False if it is missing or already claimed."""
+        task = self._tasks.get(task_id)
+        if task is None or task.status != "PENDING":
+            return False
+        task.status = "RUNNING"
+        task.updated_at = datetime.utcnow()
+        return True
+
+    async def fail_if_stale(self, task_id: str, updated_before: datetime, error_message: str) -> bool:
+        """Move a RUNNING task last updated before updated_before to FAILED. Returns whether it did."""
+        task = self._tasks.get(task_id)
+        if task is None or task.status != "RUNNING" or task.updated_at >= updated_before:
+            return False
+        await self.update_status(task_id, status="FAILED", error_message=error_message)
+        return True
+
+    async def touch_tasks(self, task_ids: List[str]) -> None:
+        """Refresh updated_at of the given tasks that are still RUNNING (the owner's heartbeat)."""
+        now = datetime.utcnow()
+        for task_id in task_ids:
             task = self._tasks.get(task_id)
-            if task is None:
-                return
-            task.status = status
-            task.updated_at = datetime.utcnow()
-            if result is not None:
-                task.result = result
-            if error_message is not None:
-                task.error_message = error_message
-            self._tasks[task_id] = task
+            if task is not None and task.status == "RUNNING":
+                task.updated_at = now
+
+    async def list_task_ids(self, status: TaskStatus) -> List[str]:
+        return [task.task_id for task in self._tasks.values() if task.status == status]
+
+    async def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._tasks),
+            "finished": len(self._finished),
+            "max_entries": self.max_entries,
+            "evicted_ttl": self._evicted_ttl,
+            "evicted_capacity": self._evicted_capacity,
+        }
+
+    def _evict(self) -> None:
+        """Drop expired finished tasks, then the oldest finished ones while over capacity."""
+        deadline = time.monotonic() - self.ttl_seconds
+        while self._finished:
+            task_id, finished_at = next(iter(self._finished.items()))
+            if finished_at <= deadline:
+                self._evicted_ttl += 1
+            elif len(self._tasks) > self.max_entries:
+                self._evicted_capacity += 1
+            else:
+                break
+            self._finished.popitem(last=False)
+            self._tasks.pop(task_id, None)
 
 
 class TaskManager:
     """
     High-level task manager that orchestrates creation and updates.
+
+    Every status transition is announced through a TaskNotifier so status
+    streams and long-polls wake up immediately instead of re-reading the store.
+
+    While started, a monitor refreshes updated_at of the tasks this process is
+    running every heartbeat_interval seconds and fails RUNNING tasks whose
+    heartbeat stopped (their worker crashed or was killed) once it is
+    running_timeout seconds old.
     """
 
-    def __init__(self, store: InMemoryTaskStore) -> None:
+    def __init__(
+        self,
+        store: TaskStore,
+        recheck_interval: Optional[float] = None,
+        running_timeout: Optional[float] = None,
+        heartbeat_interval: Optional[float] = None,
+    ) -> None:
+        """
+        Initialize the manager.
+
+        Args:
+            store: Task store backend.
+            recheck_interval: Seconds between store re-reads while waiting, which catches updates
+                made by other API worker processes. If None, reads TASK_EVENTS_RECHECK_INTERVAL.
+            running_timeout: Seconds without a heartbeat after which a RUNNING task is considered
+                abandoned (see fail_stale_tasks). If None, reads TASK_RUNNING_TIMEOUT.
+            heartbeat_interval: Seconds between heartbeats and stale-task sweeps. If None, reads
+                TASK_HEARTBEAT_INTERVAL.
+
+        Raises:
+            ValueError: If recheck_interval is not positive or running_timeout is not longer than
+                heartbeat_interval.
+        """
         self._store = store
+        self._notifier = TaskNotifier()
+        if recheck_interval is None:
+            recheck_interval = float(os.getenv("TASK_EVENTS_RECHECK_INTERVAL", "5"))
+        if recheck_interval <= 0:
+            raise ValueError(f"TaskManager recheck_interval must be positive, got {recheck_interval}")
+        self.recheck_interval = recheck_interval
+        if running_timeout is None:
+            running_timeout = float(os.getenv("TASK_RUNNING_TIMEOUT", "60"))
+        if heartbeat_interval is None:
+            heartbeat_interval = float(os.getenv("TASK_HEARTBEAT_INTERVAL", "15"))
+        if heartbeat_interval <= 0 or running_timeout <= heartbeat_interval:
+            raise ValueError(
+                f"TaskManager needs 0 < heartbeat_interval < running_timeout, "
+                f"got {heartbeat_interval} and {running_timeout}"
+            )
+        self.running_timeout = running_timeout
+        self.heartbeat_interval = heartbeat_interval
+
+        # Tasks this process claimed and has not finished yet
+        self._owned: Set[str] = set()
+        self._monitor: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Open the store and start the heartbeat / stale-task monitor."""
+        await self._store.start()
+        if self._monitor is None:
+            self._monitor = asyncio.create_task(self._monitor_running(), name="task-heartbeat")
+
+    async def close(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+        await self._store.close()
 
     async def create_task(self, task_id: str, req: CreateOutfitTaskRequest) -> TaskInfo:
         now = datetime.utcnow()
@@ -70,16 +266,102 @@ class TaskManager:
         await self._store.upsert_task(task)
         return task
 
-    async def set_running(self, task_id: str) -> None:
-        await self._store.update_status(task_id, status="RUNNING")
+    async def claim_task(self, task_id: str) -> bool:
+        """Atomically mark a PENDING task as RUNNING; False means another worker owns it."""
+        claimed = await self._store.claim_task(task_id)
+        if claimed:
+            self._owned.add(task_id)
+            self._notifier.notify(task_id)
+        return claimed
 
     async def set_succeeded(self, task_id: str, result: Dict) -> None:
         await self._store.update_status(task_id, status="SUCCEEDED", result=result)
+        self._owned.discard(task_id)
+        TASKS_FINISHED.labels("SUCCEEDED").inc()
+        self._notifier.notify(task_id)
 
     async def set_failed(self, task_id: str, error_message: str) -> None:
         await self._store.update_status(task_id, status="FAILED", error_message=error_message)
+        self._owned.discard(task_id)
+        TASKS_FINISHED.labels("FAILED").inc()
+        self._notifier.notify(task_id)
 
     async def get_task(self, task_id: str) -> Optional[TaskInfo]:
         return await self._store.get_task(task_id)
 
+    async def wait_for_change(
+        self,
+        task_id: str,
+        last_status: Optional[TaskStatus],
+        timeout: float,
+    ) -> Optional[TaskInfo]:
+        """
+        Wait until the task's status differs from last_status, or until timeout.
+
+        Returns:
+            The current task (unchanged on timeout), or None if it does not exist.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            event = self._notifier.prepare(task_id)
+            try:
+                task = await self._store.get_task(task_id)
+                remaining = deadline - loop.time()
+                if task is None or task.status != last_status or remaining <= 0:
+                    return task
+                await self._notifier.wait(event, min(remaining, self.recheck_interval))
+            finally:
+                self._notifier.release(task_id)
+
+    async def fail_stale_tasks(self) -> List[str]:
+        """
+        Fail RUNNING tasks without a heartbeat for running_timeout seconds, e.g. left behind by a killed worker.
+
+        Without this their clients would long-poll or watch the status stream forever.
+
+        Returns:
+            The ids of the tasks marked FAILED.
+        """
+        updated_before = datetime.utcnow() - timedelta(seconds=self.running_timeout)
+        failed: List[str] = []
+        for task_id in await self._store.list_task_ids("RUNNING"):
+            if await self._store.fail_if_stale(task_id, updated_before, STALE_TASK_ERROR):
+                TASKS_FINISHED.labels("FAILED").inc()
+                self._notifier.notify(task_id)
+                failed.append(task_id)
+        return failed
+
+    async def _monitor_running(self) -> None:
+        while True:
+            try:
+                if self._owned:
+                    await self._store.touch_tasks(list(self._owned))
+                await self.fail_stale_tasks()
+            except Exception:  # noqa: BLE001
+                logger.exception("Task heartbeat failed")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def list_pending_tasks(self) -> List[TaskInfo]:
+        """Tasks still waiting to be processed, e.g. left behind by a restart."""
+        tasks: List[TaskInfo] = []
+        for task_id in await self._store.list_task_ids("PENDING"):
+            task = await self._store.get_task(task_id)
+            if task is not None and task.input is not None:
+                tasks.append(task)
+        return tasks
+
+    async def stats(self) -> Dict[str, int]:
+        return {**await self._store.stats(), **self._notifier.stats()}
+
+
+def create_task_store() -> TaskStore:
+    """Create the task store selected by TASK_STORE_BACKEND ("memory" or "sqlite")."""
+    backend = os.getenv("TASK_STORE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        from .sqlite_store import SQLiteTaskStore
 
+        return SQLiteTaskStore()
+    if backend != "memory":
+        raise ValueError(f"Unknown TASK_STORE_BACKEND: {backend}")
+    return InMemoryTaskStore()
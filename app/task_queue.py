@@ -0,0 +1,141 @@
+"""Bounded in-process task queue with a fixed pool of worker coroutines."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a task is submitted while the queue is at capacity."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Task queue is full")
+        self.retry_after = retry_after
+
+
+class TaskQueue:
+    """
+    Bounded job queue drained by a fixed number of worker coroutines.
+
+    Submissions beyond ``max_size`` are rejected with QueueFullError instead of
+    spawning more concurrent work, so load above capacity turns into backpressure
+    (HTTP 429) rather than ever-growing latency.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        num_workers: Optional[int] = None,
+        retry_after: Optional[int] = None,
+    ) -> None:
+        """
+        Initialize the task queue.
+
+        Args:
+            max_size: Maximum number of queued (not yet running) jobs. If None, reads TASK_QUEUE_MAX_SIZE.
+            num_workers: Number of worker coroutines. If None, reads TASK_QUEUE_WORKERS.
+            retry_after: Seconds suggested to rejected clients. If None, reads TASK_QUEUE_RETRY_AFTER.
+
+        Raises:
+            ValueError: If any of the settings is below 1 (with no workers, accepted tasks would never run).
+        """
+        if max_size is None:
+            max_size = int(os.getenv("TASK_QUEUE_MAX_SIZE", "100"))
+        if num_workers is None:
+            num_workers = int(os.getenv("TASK_QUEUE_WORKERS", "2"))
+        if retry_after is None:
+            retry_after = int(os.getenv("TASK_QUEUE_RETRY_AFTER", "5"))
+        for name, value in (("max_size", max_size), ("num_workers", num_workers), ("retry_after", retry_after)):
+            if value < 1:
+                raise ValueError(f"TaskQueue {name} must be at least 1, got {value}")
+        self.max_size = max_size
+        self.num_workers = num_workers
+        self.retry_after = retry_after
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._in_flight = 0
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+
+    async def start(self) -> None:
+        """Create the queue and spawn the worker coroutines."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"task-queue-worker-{idx}") for idx in range(self.num_workers)
+        ]
+
+    async def stop(self) -> None:
+        """Cancel the workers. Jobs still queued are dropped."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def ensure_capacity(self) -> None:
+        """
+        Reject a request up front, before any work is done for it, if submit() would fail now.
+
+        The rejection is counted like one from submit().
+
+        Raises:
+            QueueFullError: If the queue is at capacity (or not started).
+        """
+        if self._queue is None or self._queue.full():
+            self._rejected += 1
+            raise QueueFullError(self.retry_after)
+
+    def submit(self, handler: Callable[..., Awaitable[None]], *args: Any) -> None:
+        """
+        Enqueue a job, handler(*args), without waiting.
+
+        Raises:
+            QueueFullError: If the queue is at capacity (or not started).
+        """
+        if self._queue is None:
+            self._rejected += 1
+            raise QueueFullError(self.retry_after)
+        try:
+            self._queue.put_nowait((handler, args, time.perf_counter()))
+        except asyncio.QueueFull:
+            self._rejected += 1
+            raise QueueFullError(self.retry_after) from None
+        self._submitted += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of queue depth, in-flight jobs and lifetime counters."""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self._in_flight,
+            "max_size": self.max_size,
+            "workers": self.num_workers,
+            "submitted": self._submitted,
+            "rejected": self._rejected,
+            "completed": self._completed,
+        }
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        while True:
+            handler, args, enqueued_at = await self._queue.get()
+            observe_stage("queue_wait", time.perf_counter() - enqueued_at)
+            self._in_flight += 1
+            try:
+                await handler(*args)
+            except Exception:  # noqa: BLE001
+                logger.exception("Task queue handler raised")
+            finally:
+                self._in_flight -= 1
+                self._completed += 1
+                self._queue.task_done()
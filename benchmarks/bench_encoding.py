@@ -0,0 +1,58 @@
+"""Encode time and output size per output format, using the sample images in test/.
+
+Usage:
+    python benchmarks/bench_encoding.py --size 1024 --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "inference_service"))
+
+from encoding import EncodeOptions, encode_image  # noqa: E402
+
+SAMPLES = ["hero2.jpg", "02015_00.jpg", "cat_window.png"]
+
+CASES = [
+    ("png level 1", EncodeOptions(format="png", png_compress_level=1)),
+    ("png level 6", EncodeOptions(format="png", png_compress_level=6)),
+    ("png level 9", EncodeOptions(format="png", png_compress_level=9)),
+    ("webp lossless", EncodeOptions(format="webp", webp_lossless=True, quality=50)),
+    ("webp q90", EncodeOptions(format="webp", quality=90)),
+    ("webp q80", EncodeOptions(format="webp", quality=80)),
+    ("jpeg q95", EncodeOptions(format="jpeg", quality=95)),
+    ("jpeg q85", EncodeOptions(format="jpeg", quality=85)),
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024, help="Images are resized to size x size")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    images = [
+        Image.open(ROOT / "test" / name).convert("RGB").resize((args.size, args.size)) for name in SAMPLES
+    ]
+
+    print(f"{'format':<15}{'ms / image':>12}{'KiB / image':>14}")
+    for label, options in CASES:
+        total_bytes = 0
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for image in images:
+                total_bytes += len(encode_image(image, options))
+        count = args.repeat * len(images)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / count
+        print(f"{label:<15}{elapsed_ms:>12.1f}{total_bytes / count / 1024:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Micro-benchmarks of the CPU-side work done per task, with baseline comparison.
+
+Times input decoding (full, and reduced as in _load_image), output encoding, base64 encode/decode,
+the API's result write-out, prompt building and, with --rembg, background removal,
+over the sample images in test/ at several sizes. Each case reports the median
+time, throughput and Python-heap allocations (tracemalloc: peak bytes and number
+of blocks still allocated afterwards; pixel buffers Pillow allocates in C are not
+included).
+
+Usage:
+    python benchmarks/bench_hot_paths.py --sizes 512,1024,4000 --save-baseline bench_baseline.json
+    python benchmarks/bench_hot_paths.py --sizes 512,1024 --compare bench_baseline.json --tolerance 0.15
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import PIL
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "inference_service"))
+
+from app.client import _write_file  # noqa: E402
+from app.models import CreateOutfitTaskRequest  # noqa: E402
+from app.prompts import build_prompt  # noqa: E402
+from encoding import EncodeOptions, encode_image  # noqa: E402
+from preprocess import DEFAULT_MAX_PIXELS, decode_reduced  # noqa: E402
+
+SAMPLE = "hero2.jpg"
+INPUT_FORMATS = {"jpeg": {"quality": 90}, "png": {}, "webp": {"quality": 90}}
+
+
+def _measure(fn: Callable[[], Any], repeat: int, nbytes: int = 0) -> Dict[str, float]:
+    """Median wall time over repeat runs (after one warm-up), then one run under tracemalloc."""
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+
+    result = {
+        "median_ms": median * 1000,
+        "ops_per_s": 1.0 / median if median else 0.0,
+        "peak_kib": peak / 1024,
+        "alloc_blocks": blocks,
+    }
+    if nbytes:
+        result["mb_per_s"] = nbytes / median / 1e6 if median else 0.0
+    return result
+
+
+def _sample(size: int) -> Image.Image:
+    with Image.open(ROOT / "test" / SAMPLE) as image:
+        return image.convert("RGB").resize((size, size), Image.LANCZOS)
+
+
+def _encoded(image: Image.Image, image_format: str) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format=image_format.upper(), **INPUT_FORMATS[image_format])
+    return buffer.getvalue()
+
+
+def _prompt_requests() -> List[CreateOutfitTaskRequest]:
+    """Every part combination the API accepts (1-3 accessories), with and without keep_original."""
+    parts = ["top_image_path", "pants_image_path", "shoes_image_path", "bag_image_path"]
+    requests = []
+    for count in (1, 2, 3):
+        for combo in itertools.combinations(parts, count):
+            for keep_original in (False, True):
+                fields = {name: f"test/{name}.jpg" for name in combo}
+                requests.append(
+                    CreateOutfitTaskRequest(person_image_path="test/hero2.jpg", keep_original=keep_original, **fields)
+                )
+    return requests
+
+
+def run_cases(sizes: List[int], repeat: int, with_rembg: bool) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    remove = session = None
+    if with_rembg:
+        from rembg import new_session, remove
+
+        session = new_session(os.getenv("REMBG_MODEL", "u2net"))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            image = _sample(size)
+            for image_format in INPUT_FORMATS:
+                data = _encoded(image, image_format)
+                results[f"decode/{image_format}/{size}"] = _measure(
+                    lambda data=data: Image.open(BytesIO(data)).convert("RGB"), repeat, len(data)
+                )
+                # What _load_image does now: decode near the pipeline's reference size (pays off above ~1 MP)
+                results[f"decode_reduced/{image_format}/{size}"] = _measure(
+                    lambda data=data: decode_reduced(data, DEFAULT_MAX_PIXELS), repeat, len(data)
+                )
+
+            png = encode_image(image, EncodeOptions(format="png"))
+            results[f"encode/png/{size}"] = _measure(
+                lambda: encode_image(image, EncodeOptions(format="png")), repeat, size * size * 3
+            )
+            results[f"encode/webp/{size}"] = _measure(
+                lambda: encode_image(image, EncodeOptions(format="webp")), repeat, size * size * 3
+            )
+
+            encoded = base64.b64encode(png).decode("utf-8")
+            results[f"base64/encode/{size}"] = _measure(
+                lambda: base64.b64encode(png).decode("utf-8"), repeat, len(png)
+            )
+            results[f"base64/decode/{size}"] = _measure(lambda: base64.b64decode(encoded), repeat, len(png))
+
+            # What InferenceClient does with a base64 result: decode, then write the bytes as-is
+            out_path = os.path.join(tmp_dir, f"result_{size}.png")
+            results[f"client/save_base64_result/{size}"] = _measure(
+                lambda: _write_file(out_path, base64.b64decode(encoded)), repeat, len(png)
+            )
+
+            if with_rembg:
+                results[f"rembg/{size}"] = _measure(lambda: remove(image, session=session), max(1, repeat // 4))
+
+    requests = _prompt_requests()
+    results["prompt/build_all_combinations"] = _measure(
+        lambda: [build_prompt(req) for req in requests], repeat
+    )
+    return results
+
+
+def compare(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> bool:
+    """Print per-case time ratios against the baseline; return True if nothing regressed."""
+    ok = True
+    print(f"\n{'case':<34}{'baseline ms':>13}{'now ms':>10}{'ratio':>8}")
+    for case, now in current.items():
+        before = baseline.get(case)
+        if before is None:
+            print(f"{case:<34}{'-':>13}{now['median_ms']:>10.2f}{'new':>8}")
+            continue
+        ratio = now["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        flag = ""
+        if ratio > 1.0 + tolerance:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{case:<34}{before['median_ms']:>13.2f}{now['median_ms']:>10.2f}{ratio:>8.2f}{flag}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="512,1024", help="Comma-separated square image sizes")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--rembg", action="store_true", help="Also time rembg (needs rembg and its model)")
+    parser.add_argument("--save-baseline", type=Path, default=None, help="Write results to this JSON file")
+    parser.add_argument("--compare", type=Path, default=None, help="Compare against a saved baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown before flagging (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = run_cases(sizes, args.repeat, args.rembg)
+
+    print(f"{'case':<34}{'median ms':>11}{'ops/s':>10}{'MB/s':>9}{'peak KiB':>10}{'blocks':>8}")
+    for case, r in results.items():
+        mb_per_s = f"{r['mb_per_s']:.0f}" if "mb_per_s" in r else "-"
+        print(
+            f"{case:<34}{r['median_ms']:>11.2f}{r['ops_per_s']:>10.1f}{mb_per_s:>9}"
+            f"{r['peak_kib']:>10.0f}{r['alloc_blocks']:>8.0f}"
+        )
+
+    if args.save_baseline:
+        meta = {"python": platform.python_version(), "pillow": PIL.__version__, "machine": platform.machine()}
+        args.save_baseline.write_text(json.dumps({"meta": meta, "results": results}, indent=2), encoding="utf-8")
+    if args.compare:
+        baseline: Optional[Dict[str, Any]] = json.loads(args.compare.read_text(encoding="utf-8"))
+        if not compare(results, baseline["results"], args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Compare status-update and lookup throughput of the task store backends.
+
+Usage:
+    python benchmarks/bench_task_store.py --tasks 2000 --concurrency 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.models import CreateOutfitTaskRequest  # noqa: E402
+from app.sqlite_store import SQLiteTaskStore  # noqa: E402
+from app.store import InMemoryTaskStore, TaskManager, TaskStore  # noqa: E402
+
+
+async def _run_concurrently(fn, items, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            await fn(item)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(item) for item in items))
+    return time.perf_counter() - start
+
+
+async def bench(name: str, store: TaskStore, num_tasks: int, concurrency: int) -> None:
+    manager = TaskManager(store)
+    await manager.start()
+    try:
+        req = CreateOutfitTaskRequest(person_image_path="test/hero2.jpg", top_image_path="test/02015_00.jpg")
+        task_ids = [uuid.uuid4().hex for _ in range(num_tasks)]
+
+        create_s = await _run_concurrently(lambda t: manager.create_task(t, req), task_ids, concurrency)
+        running_s = await _run_concurrently(manager.claim_task, task_ids, concurrency)
+        done_s = await _run_concurrently(
+            lambda t: manager.set_succeeded(t, {"image_path": f"outputs/{t}.png"}), task_ids, concurrency
+        )
+        lookup_s = await _run_concurrently(manager.get_task, task_ids * 5, concurrency)
+
+        updates = num_tasks * 2
+        print(
+            f"{name:>8}: create {num_tasks / create_s:10.0f}/s  "
+            f"status update {updates / (running_s + done_s):10.0f}/s  "
+            f"lookup {num_tasks * 5 / lookup_s:10.0f}/s"
+        )
+    finally:
+        await manager.close()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    await bench("memory", InMemoryTaskStore(), args.tasks, args.concurrency)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = SQLiteTaskStore(path=os.path.join(tmp_dir, "tasks.db"))
+        await bench("sqlite", store, args.tasks, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,310 @@
+"""End-to-end load test of the API against the stub inference service.
+
+Starts stub_inference.py and main:app as uvicorn subprocesses (CPU only), replays
+a workload of task requests at a fixed concurrency or arrival rate, follows each
+task to completion with long-polling, and reports throughput, submit-to-success
+latency percentiles and error rates. Exits non-zero when a --max-* gate fails.
+
+Usage:
+    python benchmarks/loadtest/run.py --concurrency 8 --duration 60
+    python benchmarks/loadtest/run.py --rate 2 --requests 200 --infer-latency 1.5 --infer-failure-rate 0.01
+    python benchmarks/loadtest/run.py --api-url http://localhost:8000 --concurrency 4 --duration 30
+
+Each workload line is a CreateOutfitTaskRequest body; relative image paths are
+resolved against the repository root. Unless --keep-seeds is given every request
+gets a fresh seed so identical lines are not served by task deduplication.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent.parent
+FINISHED = ("SUCCEEDED", "FAILED")
+
+
+@dataclass
+class Results:
+    latencies: List[float] = field(default_factory=list)
+    sent: int = 0
+    failed: int = 0
+    rejected: int = 0
+    errors: int = 0
+    error_samples: List[str] = field(default_factory=list)
+
+    def record_error(self, message: str) -> None:
+        self.errors += 1
+        if len(self.error_samples) < 5:
+            self.error_samples.append(message)
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def load_workload(path: Path) -> List[Dict[str, Any]]:
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            body = json.loads(line)
+            for key, value in body.items():
+                if key.endswith("_image_path") and value and "://" not in value and not os.path.isabs(value):
+                    body[key] = str(ROOT / value)
+            items.append(body)
+    if not items:
+        raise SystemExit(f"Workload {path} is empty")
+    return items
+
+
+async def run_one(client: httpx.AsyncClient, body: Dict[str, Any], results: Results, poll_wait: float) -> None:
+    results.sent += 1
+    start = time.perf_counter()
+    try:
+        response = await client.post("/api/v1/outfit/tasks", json=body)
+        if response.status_code == 429:
+            results.rejected += 1
+            return
+        response.raise_for_status()
+        task = response.json()
+        while task["status"] not in FINISHED:
+            response = await client.get(f"/api/v1/outfit/tasks/{task['task_id']}", params={"wait": poll_wait})
+            response.raise_for_status()
+            task = response.json()
+    except Exception as exc:  # noqa: BLE001
+        results.record_error(f"{type(exc).__name__}: {exc}")
+        return
+    if task["status"] == "SUCCEEDED":
+        results.latencies.append(time.perf_counter() - start)
+    else:
+        results.failed += 1
+        if len(results.error_samples) < 5:
+            results.error_samples.append(f"FAILED: {task.get('error_message')}")
+
+
+def _next_body(workload: List[Dict[str, Any]], index: int, keep_seeds: bool) -> Dict[str, Any]:
+    body = dict(workload[index % len(workload)])
+    if not keep_seeds:
+        body["seed"] = random.randrange(2**31)
+    return body
+
+
+async def drive(args: argparse.Namespace, api_url: str, workload: List[Dict[str, Any]]) -> Dict[str, Any]:
+    results = Results()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    timeout = httpx.Timeout(args.poll_wait + 30.0)
+    async with httpx.AsyncClient(base_url=api_url, limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        deadline = start + args.duration if args.duration else None
+
+        def more(index: int) -> bool:
+            if args.requests is not None and index >= args.requests:
+                return False
+            return deadline is None or time.perf_counter() < deadline
+
+        counter = 0
+        if args.rate:
+            # Open loop: arrivals follow a Poisson process regardless of how fast the API answers
+            pending = []
+            while more(counter):
+                body = _next_body(workload, counter, args.keep_seeds)
+                pending.append(asyncio.create_task(run_one(client, body, results, args.poll_wait)))
+                counter += 1
+                await asyncio.sleep(random.expovariate(args.rate))
+            await asyncio.gather(*pending)
+        else:
+            # Closed loop: each virtual user submits its next task when the previous one finishes
+            async def user() -> None:
+                nonlocal counter
+                while more(counter):
+                    body = _next_body(workload, counter, args.keep_seeds)
+                    counter += 1
+                    await run_one(client, body, results, args.poll_wait)
+
+            await asyncio.gather(*(user() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+        try:
+            server_stats = (await client.get("/api/v1/stats")).json()
+        except Exception:  # noqa: BLE001
+            server_stats = None
+
+    succeeded = len(results.latencies)
+    return {
+        "mode": f"rate {args.rate}/s" if args.rate else f"concurrency {args.concurrency}",
+        "elapsed_s": elapsed,
+        "sent": results.sent,
+        "succeeded": succeeded,
+        "failed": results.failed,
+        "rejected_429": results.rejected,
+        "errors": results.errors,
+        "throughput_per_s": succeeded / elapsed if elapsed else 0.0,
+        "error_rate": (results.sent - succeeded) / results.sent if results.sent else 0.0,
+        "latency_s": {
+            "p50": _percentile(results.latencies, 50),
+            "p95": _percentile(results.latencies, 95),
+            "p99": _percentile(results.latencies, 99),
+            "max": max(results.latencies) if results.latencies else None,
+        },
+        "error_samples": results.error_samples,
+        "server_stats": server_stats,
+    }
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Process serving {url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+@contextmanager
+def services(args: argparse.Namespace) -> Iterator[str]:
+    """Start the stub and the API in a scratch directory; yield the API base URL."""
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    stub_env = {
+        **os.environ,
+        "STUB_INFER_LATENCY": str(args.infer_latency),
+        "STUB_BG_LATENCY": str(args.bg_latency),
+        "STUB_JITTER": str(args.jitter),
+        "STUB_INFER_FAILURE_RATE": str(args.infer_failure_rate),
+        "STUB_BG_FAILURE_RATE": str(args.bg_failure_rate),
+        "STUB_INFER_CONCURRENCY": str(args.stub_concurrency),
+    }
+    api_env = {**os.environ, "INFERENCE_SERVICE_URL": stub_url}
+    uvicorn = [sys.executable, "-m", "uvicorn", "--log-level", "warning", "--host", "127.0.0.1"]
+
+    with tempfile.TemporaryDirectory(prefix="ootd-loadtest-") as workdir:
+        # The API writes outputs/ relative to its working directory; keep that out of the repo
+        stub = subprocess.Popen(
+            [*uvicorn, "--app-dir", str(HERE), "--port", str(args.stub_port), "stub_inference:app"],
+            cwd=workdir,
+            env=stub_env,
+        )
+        api = None
+        try:
+            _wait_ready(f"{stub_url}/health", stub)
+            api = subprocess.Popen(
+                [*uvicorn, "--app-dir", str(ROOT), "--port", str(args.api_port), "main:app"],
+                cwd=workdir,
+                env=api_env,
+            )
+            _wait_ready(f"{api_url}/api/v1/stats", api)
+            yield api_url
+        finally:
+            for process in (api, stub):
+                if process is not None:
+                    process.terminate()
+                    try:
+                        process.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    latency = report["latency_s"]
+
+    def fmt(value: Optional[float]) -> str:
+        return f"{value:.3f}s" if value is not None else "-"
+
+    print(f"mode:        {report['mode']}, {report['elapsed_s']:.1f}s")
+    print(
+        f"requests:    sent {report['sent']}, succeeded {report['succeeded']}, failed {report['failed']}, "
+        f"rejected (429) {report['rejected_429']}, errors {report['errors']}"
+    )
+    print(f"throughput:  {report['throughput_per_s']:.2f} tasks/s")
+    print(f"error rate:  {report['error_rate']:.2%}")
+    print(
+        f"latency:     p50 {fmt(latency['p50'])}  p95 {fmt(latency['p95'])}  "
+        f"p99 {fmt(latency['p99'])}  max {fmt(latency['max'])}"
+    )
+    for sample in report["error_samples"]:
+        print(f"  e.g. {sample}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workload", type=Path, default=HERE / "workload.example.jsonl")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, default=4, help="Closed loop: number of virtual users")
+    load.add_argument("--rate", type=float, default=None, help="Open loop: task submissions per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to submit for (0 = until --requests)")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after this many submissions")
+    parser.add_argument("--keep-seeds", action="store_true", help="Send workload seeds as-is (allows deduplication)")
+    parser.add_argument("--poll-wait", type=float, default=30.0, help="Long-poll wait per status request")
+    parser.add_argument("--api-url", default=None, help="Target a running API instead of starting one with the stub")
+    parser.add_argument("--api-port", type=int, default=18000)
+    parser.add_argument("--stub-port", type=int, default=18001)
+    parser.add_argument("--infer-latency", type=float, default=2.0)
+    parser.add_argument("--bg-latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--infer-failure-rate", type=float, default=0.0)
+    parser.add_argument("--bg-failure-rate", type=float, default=0.0)
+    parser.add_argument("--stub-concurrency", type=int, default=1, help="Images the stub generates at once")
+    parser.add_argument("--json", type=Path, default=None, help="Also write the report as JSON")
+    parser.add_argument("--max-p95", type=float, default=None, help="Fail if p95 latency exceeds this (seconds)")
+    parser.add_argument("--max-p99", type=float, default=None, help="Fail if p99 latency exceeds this (seconds)")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="Fail if the error rate exceeds this")
+    parser.add_argument("--min-throughput", type=float, default=None, help="Fail below this many tasks/s")
+    args = parser.parse_args()
+    if not args.duration and args.requests is None:
+        parser.error("--duration 0 needs --requests")
+
+    workload = load_workload(args.workload)
+    if args.api_url:
+        report = asyncio.run(drive(args, args.api_url, workload))
+    else:
+        with services(args) as api_url:
+            report = asyncio.run(drive(args, api_url, workload))
+
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    latency = report["latency_s"]
+    failures = []
+    if args.max_p95 is not None and (latency["p95"] is None or latency["p95"] > args.max_p95):
+        failures.append(f"p95 {latency['p95']} > {args.max_p95}")
+    if args.max_p99 is not None and (latency["p99"] is None or latency["p99"] > args.max_p99):
+        failures.append(f"p99 {latency['p99']} > {args.max_p99}")
+    if args.max_error_rate is not None and report["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {report['error_rate']:.4f} > {args.max_error_rate}")
+    if args.min_throughput is not None and report["throughput_per_s"] < args.min_throughput:
+        failures.append(f"throughput {report['throughput_per_s']:.3f} < {args.min_throughput}")
+    if failures:
+        print("GATE FAILED: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
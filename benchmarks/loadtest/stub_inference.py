@@ -0,0 +1,111 @@
+"""CPU-only stand-in for the inference service, for load-testing the API.
+
+Implements /infer, /infer_batch, /remove_background and /health with the same
+request/response contract as inference_service/main.py, but sleeps instead of
+running models. Behaviour is set through environment variables:
+
+    STUB_INFER_LATENCY       seconds per generated image (default 2.0)
+    STUB_BG_LATENCY          seconds per background removal (default 0.3)
+    STUB_JITTER              relative latency jitter, 0.2 = +/-20% (default 0.2)
+    STUB_INFER_FAILURE_RATE  fraction of /infer items that fail (default 0)
+    STUB_BG_FAILURE_RATE     fraction of /remove_background calls that fail (default 0)
+    STUB_INFER_CONCURRENCY   images generated at once, like GPUs in the real service (default 1)
+
+Usage:
+    python -m uvicorn stub_inference:app --app-dir benchmarks/loadtest --port 18001
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import os
+import random
+import shutil
+from functools import lru_cache
+from io import BytesIO
+from typing import Any, Dict, Tuple
+
+from fastapi import Body, FastAPI, Response
+from PIL import Image
+
+INFER_LATENCY = float(os.getenv("STUB_INFER_LATENCY", "2.0"))
+BG_LATENCY = float(os.getenv("STUB_BG_LATENCY", "0.3"))
+JITTER = float(os.getenv("STUB_JITTER", "0.2"))
+INFER_FAILURE_RATE = float(os.getenv("STUB_INFER_FAILURE_RATE", "0"))
+BG_FAILURE_RATE = float(os.getenv("STUB_BG_FAILURE_RATE", "0"))
+
+_MEDIA_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+_EXTENSIONS = {"png": "png", "webp": "webp", "jpeg": "jpg"}
+
+app = FastAPI(title="OOTD Inference Stub")
+_gpu = asyncio.Semaphore(int(os.getenv("STUB_INFER_CONCURRENCY", "1")))
+_counters: Dict[str, int] = {"infer": 0, "infer_failed": 0, "remove_background": 0, "remove_background_failed": 0}
+
+
+def _latency(mean: float) -> float:
+    return max(0.0, mean * random.uniform(1.0 - JITTER, 1.0 + JITTER))
+
+
+@lru_cache(maxsize=32)
+def _image_bytes(width: int, height: int, image_format: str) -> bytes:
+    """A flat-colour image of the requested size, encoded once per (size, format)."""
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), (200, 180, 160)).save(buffer, format=image_format.upper())
+    return buffer.getvalue()
+
+
+async def _generate(item: Dict[str, Any], allow_binary: bool) -> Tuple[Dict[str, Any], Response | None]:
+    """Return (JSON result, binary response or None) for one inference item."""
+    async with _gpu:
+        await asyncio.sleep(_latency(INFER_LATENCY))
+    _counters["infer"] += 1
+    if random.random() < INFER_FAILURE_RATE:
+        _counters["infer_failed"] += 1
+        return {"success": False, "image_base64": None, "error_message": "stub: injected failure"}, None
+
+    image_format = item.get("output_format") or "png"
+    data = _image_bytes(int(item.get("width", 1024)), int(item.get("height", 1024)), image_format)
+    mode = item.get("response_mode", "base64")
+    if mode == "binary" and allow_binary:
+        return {}, Response(content=data, media_type=_MEDIA_TYPES[image_format])
+    if mode == "file":
+        output_path = item["output_path"]
+        if not os.path.splitext(output_path)[1]:
+            output_path = f"{output_path}.{_EXTENSIONS[image_format]}"
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, "wb") as f:
+            f.write(data)
+        return {"success": True, "output_path": output_path, "image_format": image_format}, None
+    return {"success": True, "image_base64": base64.b64encode(data).decode(), "image_format": image_format}, None
+
+
+@app.post("/infer")
+async def infer(item: Dict[str, Any] = Body(...)):
+    result, binary = await _generate(item, allow_binary=True)
+    return binary if binary is not None else result
+
+
+@app.post("/infer_batch")
+async def infer_batch(body: Dict[str, Any] = Body(...)):
+    return {"results": [(await _generate(item, allow_binary=False))[0] for item in body["items"]]}
+
+
+@app.post("/remove_background")
+async def remove_background(body: Dict[str, Any] = Body(...)):
+    await asyncio.sleep(_latency(BG_LATENCY))
+    _counters["remove_background"] += 1
+    if random.random() < BG_FAILURE_RATE:
+        _counters["remove_background_failed"] += 1
+        return {"success": False, "output_path": None, "error_message": "stub: injected failure"}
+    image_path = body["image_path"]
+    output_path = body.get("output_path") or image_path
+    if output_path != image_path and os.path.exists(image_path):
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        shutil.copyfile(image_path, output_path)
+    return {"success": True, "output_path": output_path}
+
+
+@app.get("/health")
+async def health() -> dict:
+    return {"status": "ok", "service": "inference-stub", "counters": _counters}
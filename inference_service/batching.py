@@ -0,0 +1,193 @@
+"""Dynamic micro-batching of generation requests."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from PIL import Image
+
+from executors import ExecutorLane
+from metrics import BATCH_SIZE, observe_stage
+
+
+@dataclass
+class GenerationJob:
+    """One image to generate, plus the future its caller is waiting on."""
+
+    prompt: str
+    image_paths: List[str]
+    height: int
+    width: int
+    guidance_scale: float
+    num_inference_steps: int
+    seed: Optional[int] = None
+    # Content hashes of image_paths; when set, batches are keyed on them instead of the paths
+    image_digests: Optional[Tuple[str, ...]] = None
+    # Profiled jobs always run alone so the profile covers exactly one request
+    profiler: Any = None
+    future: Optional[asyncio.Future] = None
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def batch_key(self) -> Hashable:
+        """
+        Jobs with equal keys can share one pipeline call.
+
+        The pipeline conditions every prompt in a batch on the same reference
+        images, so beyond matching size, steps and guidance the image set itself
+        must be identical. Comparing content rather than paths matters: the API
+        writes every task's cutouts to paths of its own.
+        """
+        if self.profiler is not None:
+            return id(self)
+        images = self.image_digests if self.image_digests is not None else tuple(self.image_paths)
+        return (images, self.height, self.width, self.guidance_scale, self.num_inference_steps)
+
+
+RunBatch = Callable[[List[GenerationJob]], List[Image.Image]]
+
+
+class MicroBatcher:
+    """
+    Collects generation jobs for a short window and runs compatible ones as one batch.
+
+    A single scheduler coroutine takes the oldest waiting job and hands it,
+    together with the waiting jobs that share its batch key (up to
+    max_batch_size), to run_batch on the generation lane. Only when the oldest
+    job already has a companion does it wait up to max_wait seconds for more;
+    a job with no match runs at once, so requests that cannot batch (the
+    common case: different people or garments) pay no added latency. Jobs
+    that arrive while a batch is running are grouped on the next round, so
+    under load batches fill up without any added wait. Incompatible jobs keep
+    their place in line.
+    """
+
+    def __init__(
+        self,
+        run_batch: RunBatch,
+        lane: ExecutorLane,
+        max_batch_size: Optional[int] = None,
+        max_wait: Optional[float] = None,
+    ) -> None:
+        """
+        Initialize the batcher.
+
+        Args:
+            run_batch: Generates one image per job, in order; called on a lane thread.
+            lane: Executor lane the batches run on, one batch at a time.
+            max_batch_size: Most jobs per pipeline call; 1 (or less) disables batching. If None, reads INFER_MAX_BATCH_SIZE.
+            max_wait: Seconds to wait for further companions once the oldest job has one. If None, reads INFER_BATCH_WAIT.
+        """
+        self.run_batch = run_batch
+        self.lane = lane
+        if max_batch_size is None:
+            max_batch_size = int(os.getenv("INFER_MAX_BATCH_SIZE", "4"))
+        # A batch size below 1 would make the scheduler spin without ever awaiting
+        self.max_batch_size = max(1, max_batch_size)
+        if max_wait is None:
+            max_wait = float(os.getenv("INFER_BATCH_WAIT", "0.05"))
+        self.max_wait = max(0.0, max_wait)
+
+        self._intake: Optional[asyncio.Queue] = None
+        self._pending: List[GenerationJob] = []
+        self._scheduler: Optional[asyncio.Task] = None
+        self._batches = 0
+        self._jobs = 0
+
+    async def start(self) -> None:
+        if self._scheduler is not None:
+            return
+        self._intake = asyncio.Queue()
+        self._scheduler = asyncio.create_task(self._schedule(), name="micro-batcher")
+
+    async def stop(self) -> None:
+        if self._scheduler is None:
+            return
+        self._scheduler.cancel()
+        await asyncio.gather(self._scheduler, return_exceptions=True)
+        self._scheduler = None
+
+    async def submit(self, job: GenerationJob) -> Image.Image:
+        """Queue a job and wait for its image."""
+        if self._scheduler is None:
+            await self.start()
+        assert self._intake is not None
+        job.future = asyncio.get_running_loop().create_future()
+        await self._intake.put(job)
+        return await job.future
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "waiting": len(self._pending) + (self._intake.qsize() if self._intake is not None else 0),
+            "batches": self._batches,
+            "jobs": self._jobs,
+            "mean_batch_size": self._jobs / self._batches if self._batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+        }
+
+    async def _schedule(self) -> None:
+        assert self._intake is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending:
+                self._pending.append(await self._intake.get())
+            self._drain_intake()
+            key = self._pending[0].batch_key
+            deadline = loop.time() + self.max_wait
+            # Without a companion already waiting, batching is unlikely; run the job now
+            while 1 < self._count(key) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._pending.append(await asyncio.wait_for(self._intake.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                self._drain_intake()
+
+            batch, rest = self._take(key)
+            self._pending = rest
+            # Drop jobs whose callers went away while waiting
+            batch = [job for job in batch if job.future is not None and not job.future.done()]
+            if not batch:
+                continue
+
+            BATCH_SIZE.observe(len(batch))
+            self._batches += 1
+            self._jobs += len(batch)
+            started = time.perf_counter()
+            for job in batch:
+                observe_stage("batch_wait", started - job.enqueued_at)
+            try:
+                # The scheduler awaits each batch, so batches never overlap on the GPU
+                images = await self.lane.run(self.run_batch, batch)
+            except Exception as exc:  # noqa: BLE001
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(exc)
+                continue
+            for job, image in zip(batch, images):
+                if not job.future.done():
+                    job.future.set_result(image)
+
+    def _drain_intake(self) -> None:
+        assert self._intake is not None
+        while not self._intake.empty():
+            self._pending.append(self._intake.get_nowait())
+
+    def _count(self, key: Hashable) -> int:
+        return sum(1 for job in self._pending if job.batch_key == key)
+
+    def _take(self, key: Hashable) -> Tuple[List[GenerationJob], List[GenerationJob]]:
+        batch: List[GenerationJob] = []
+        rest: List[GenerationJob] = []
+        for job in self._pending:
+            if job.batch_key == key and len(batch) < self.max_batch_size:
+                batch.append(job)
+            else:
+                rest.append(job)
+        return batch, rest
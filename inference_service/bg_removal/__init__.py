@@ -1,6 +1,6 @@
 """Background removal module - can be used as a library or via HTTP API."""
 
-from .remover import remove_background
+from .remover import remove_background, remove_background_bytes
 
-__all__ = ["remove_background"]
+__all__ = ["remove_background", "remove_background_bytes"]
 
@@ -0,0 +1,160 @@
+"""Content-addressed on-disk cache for background-removal results."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict
+
+from PIL import Image
+
+
+class BackgroundRemovalCache:
+    """
+    Disk cache of cutouts keyed by a hash of the input image bytes and the rembg model.
+
+    Entries are evicted least-recently-used first once the total size exceeds
+    max_bytes. Concurrent requests for the same key are coalesced: the first
+    caller computes the cutout while the others wait for it and then read the
+    cached file.
+    """
+
+    def __init__(self, cache_dir: str | None = None, max_bytes: int | None = None) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory holding cached PNGs. If None, reads BG_CACHE_DIR.
+            max_bytes: Disk budget in bytes; 0 disables caching. If None, reads BG_CACHE_MAX_BYTES.
+        """
+        self.cache_dir = cache_dir or os.getenv("BG_CACHE_DIR", os.path.join("outputs", "bg_cache"))
+        if max_bytes is None:
+            max_bytes = int(os.getenv("BG_CACHE_MAX_BYTES", str(2 * 1024**3)))
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> file size, oldest first
+        self._total_bytes = 0
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model_name: str) -> str:
+        """Derive the cache key from the raw input bytes and the rembg model name."""
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def get_or_compute(self, key: str, compute: Callable[[], Image.Image]) -> str:
+        """
+        Return the path of the cached cutout for key, computing it on a miss.
+
+        Args:
+            key: Cache key from make_key().
+            compute: Produces the cutout image; called at most once per key at a time.
+
+        Returns:
+            Path to the cached PNG.
+        """
+        while True:
+            with self._lock:
+                hit = key in self._entries
+                if hit:
+                    self._entries.move_to_end(key)
+                else:
+                    event = self._inflight.get(key)
+                    if event is None:
+                        event = threading.Event()
+                        self._inflight[key] = event
+                        self.misses += 1
+                        break
+            if hit:
+                path = self.path_for(key)
+                try:
+                    # Keep mtime in step with recency so the LRU order survives restarts
+                    os.utime(path, None)
+                except FileNotFoundError:
+                    # Deleted out of band: forget the entry and compute it again
+                    self.discard(key)
+                    continue
+                with self._lock:
+                    self.hits += 1
+                return path
+            # Another thread is computing this key; wait and re-check (it may have failed)
+            event.wait()
+
+        try:
+            image = compute()
+            path = self.path_for(key)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            image.save(tmp_path, format="PNG")
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._add_entry(key, os.path.getsize(path))
+            return path
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def discard(self, key: str) -> None:
+        """Forget key if its file has gone missing (a later get_or_compute recomputes it)."""
+        with self._lock:
+            if key in self._entries and not os.path.exists(self.path_for(key)):
+                self._total_bytes -= self._entries.pop(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU index from files left by a previous process (oldest mtime first)."""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".png"):
+                continue
+            st = os.stat(os.path.join(self.cache_dir, name))
+            files.append((st.st_mtime, name[: -len(".png")], st.st_size))
+        for _, key, size in sorted(files):
+            self._add_entry(key, size)
+
+    def _add_entry(self, key: str, size: int) -> None:
+        # Caller holds self._lock
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._total_bytes -= previous
+        self._entries[key] = size
+        self._total_bytes += size
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            old_key, old_size = self._entries.popitem(last=False)
+            self._total_bytes -= old_size
+            self.evictions += 1
+            try:
+                os.remove(self.path_for(old_key))
+            except FileNotFoundError:
+                pass
@@ -2,6 +2,8 @@
 
 from __future__ import annotations
 
+from typing import List
+
 from pydantic import BaseModel, Field
 
 
@@ -17,5 +19,27 @@ class BackgroundRemovalResponse(BaseModel):
 
     success: bool = Field(..., description="Whether background removal succeeded")
     output_path: str | None = Field(default=None, description="Path to image with background removed")
+    image_base64: str | None = Field(default=None, description="Base64 PNG cutout (batch requests with return_base64)")
     error_message: str | None = Field(default=None, description="Error message if removal failed")
 
+
+class BackgroundRemovalItem(BaseModel):
+    """One image of a batch background-removal request; set image_path or image_base64."""
+
+    image_path: str | None = Field(default=None, description="Path to image (local or URL)")
+    image_base64: str | None = Field(default=None, description="Inline image bytes, base64-encoded")
+    output_path: str | None = Field(default=None, description="Optional output path")
+
+
+class BackgroundRemovalBatchRequest(BaseModel):
+    """Request model for removing the background of several images in one call."""
+
+    items: List[BackgroundRemovalItem] = Field(..., description="Images to process", min_items=1, max_items=64)
+    return_base64: bool = Field(default=False, description="Also return each cutout as base64 PNG")
+
+
+class BackgroundRemovalBatchResponse(BaseModel):
+    """Per-item results, in request order; a failing item does not fail the others."""
+
+    results: List[BackgroundRemovalResponse]
+
@@ -0,0 +1,220 @@
+"""Pool of rembg worker processes, each with its own ONNX Runtime session."""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+# Cutouts are RGBA
+_OUTPUT_CHANNELS = 4
+
+# Session of the current worker process (set by _init_worker)
+_WORKER_SESSION = None
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects CPU affinity / container cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def configured_threads() -> Tuple[int, int]:
+    """ONNX Runtime (intra-op, inter-op) threads per worker, from BG_REMOVAL_THREADS / BG_REMOVAL_INTER_THREADS."""
+    return int(os.getenv("BG_REMOVAL_THREADS", "2")), int(os.getenv("BG_REMOVAL_INTER_THREADS", "1"))
+
+
+def configured_processes() -> int:
+    """
+    Number of worker processes from BG_REMOVAL_PROCESSES.
+
+    Defaults to one worker per BG_REMOVAL_THREADS cores, so the pool fills the
+    host without oversubscribing it; 0 means run rembg in-process instead.
+    """
+    value = os.getenv("BG_REMOVAL_PROCESSES")
+    if value is not None and value.strip():
+        return max(0, int(value))
+    intra_threads, _ = configured_threads()
+    return max(1, available_cores() // max(1, intra_threads))
+
+
+def _apply_thread_settings(session, intra_threads: int, inter_threads: int) -> None:
+    """Rebuild the session's ONNX Runtime session with explicit thread settings."""
+    inner = getattr(session, "inner_session", None)
+    model_path = getattr(inner, "_model_path", None)
+    if inner is None or not isinstance(model_path, str):
+        # Unknown rembg internals: keep its session, which honours OMP_NUM_THREADS
+        return
+
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_threads
+    options.inter_op_num_threads = inter_threads
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    # Idle workers should yield their cores instead of busy-waiting for the next job
+    options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+    session.inner_session = ort.InferenceSession(model_path, sess_options=options, providers=inner.get_providers())
+
+
+def _init_worker(model_name: str, intra_threads: int, inter_threads: int) -> None:
+    """Load the rembg session once per worker process."""
+    global _WORKER_SESSION
+    # rembg reads this when it builds the session; _apply_thread_settings then sets both counts exactly
+    os.environ["OMP_NUM_THREADS"] = str(intra_threads)
+    from rembg import new_session
+
+    _WORKER_SESSION = new_session(model_name)
+    _apply_thread_settings(_WORKER_SESSION, intra_threads, inter_threads)
+
+
+def _remove_in_worker(shm_name: str, input_size: int, output_capacity: int) -> Tuple[str, Tuple[int, int], int]:
+    """
+    Run rembg on the encoded image at the start of the shared block.
+
+    The cutout's raw pixels are written right after the input; only the mode,
+    size and byte count travel back through the result pipe.
+    """
+    from rembg import remove
+
+    shm = SharedMemory(name=shm_name)
+    try:
+        with shm.buf[:input_size] as view:
+            encoded = bytes(view)
+        with Image.open(BytesIO(encoded)) as image:
+            input_image = image.convert("RGB")
+        cutout = remove(input_image, session=_WORKER_SESSION)
+        data = cutout.tobytes()
+        if len(data) > output_capacity:
+            raise ValueError(f"Cutout of {len(data)} bytes does not fit the {output_capacity}-byte output buffer")
+        shm.buf[input_size : input_size + len(data)] = data
+        return cutout.mode, cutout.size, len(data)
+    finally:
+        shm.close()
+
+
+class RembgProcessPool:
+    """
+    Runs background removal on a pool of worker processes.
+
+    Each worker owns a rembg session with explicit ONNX Runtime thread counts,
+    so removals neither share a GIL with the diffusion pipeline nor fight each
+    other for cores. Input bytes and output pixels are exchanged through one
+    shared-memory block per job instead of being pickled. Workers are started
+    with spawn (forking a process that holds a CUDA context is unsafe) and only
+    when the first job arrives.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        processes: Optional[int] = None,
+        intra_threads: Optional[int] = None,
+        inter_threads: Optional[int] = None,
+    ) -> None:
+        """
+        Initialize the pool.
+
+        Args:
+            model_name: rembg model each worker loads.
+            processes: Worker processes. If None, reads BG_REMOVAL_PROCESSES (see configured_processes).
+            intra_threads: ONNX Runtime intra-op threads per worker. If None, reads BG_REMOVAL_THREADS.
+            inter_threads: ONNX Runtime inter-op threads per worker. If None, reads BG_REMOVAL_INTER_THREADS.
+        """
+        default_intra, default_inter = configured_threads()
+        self.model_name = model_name
+        self.processes = max(1, processes or configured_processes())
+        self.intra_threads = intra_threads or default_intra
+        self.inter_threads = inter_threads or default_inter
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._restarts = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self.intra_threads, self.inter_threads),
+                )
+            return self._executor
+
+    def remove(self, image_bytes: bytes) -> Image.Image:
+        """Remove the background of an encoded image on a worker; blocks until done."""
+        with Image.open(BytesIO(image_bytes)) as image:
+            width, height = image.size
+        output_capacity = width * height * _OUTPUT_CHANNELS
+
+        shm = SharedMemory(create=True, size=len(image_bytes) + output_capacity)
+        with self._lock:
+            self._in_flight += 1
+        try:
+            shm.buf[: len(image_bytes)] = image_bytes
+            executor = self._get_executor()
+            try:
+                mode, size, nbytes = executor.submit(
+                    _remove_in_worker, shm.name, len(image_bytes), output_capacity
+                ).result()
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); start a fresh pool on the next call
+                self._reset(executor)
+                raise
+            with shm.buf[len(image_bytes) : len(image_bytes) + nbytes] as view:
+                cutout = Image.frombytes(mode, size, bytes(view))
+        except BaseException:
+            with self._lock:
+                self._failed += 1
+            raise
+        else:
+            with self._lock:
+                self._completed += 1
+            return cutout
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            shm.close()
+            shm.unlink()
+
+    def warm(self, image_bytes: bytes) -> None:
+        """Start every worker (each loads its session on start) by running one removal per worker at once."""
+        with ThreadPoolExecutor(max_workers=self.processes) as executor:
+            list(executor.map(self.remove, [image_bytes] * self.processes))
+
+    def _reset(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+                self._restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "processes": self.processes,
+            "intra_threads": self.intra_threads,
+            "inter_threads": self.inter_threads,
+            "in_flight": self._in_flight,
+            "completed": self._completed,
+            "failed": self._failed,
+            "restarts": self._restarts,
+        }
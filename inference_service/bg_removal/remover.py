@@ -2,26 +2,113 @@
 
 from __future__ import annotations
 
+import hashlib
 import os
+import shutil
+import threading
+import time
 from io import BytesIO
 from urllib.parse import urlparse
 
-import requests
 from PIL import Image
 from rembg import new_session, remove
 
+from fetch import get_fetcher
+from metrics import MODEL_LOAD_SECONDS, stage_timer, timed
+
+from .cache import BackgroundRemovalCache
+from .pool import RembgProcessPool, configured_processes
+
+# rembg model used for all sessions; part of the cache key
+REMBG_MODEL = os.getenv("REMBG_MODEL", "u2net")
+
 # Global session to cache the model (loaded once, reused for all requests)
 _BG_REMOVAL_SESSION = None
+# Removals run on several worker threads; only one of them may create the session
+_SESSION_LOCK = threading.Lock()
+
+# Worker processes doing the removals (created on first use; None when BG_REMOVAL_PROCESSES=0)
+_BG_REMOVAL_POOL: RembgProcessPool | None = None
+
+# Content-addressed cache of cutouts (created on first use)
+_BG_REMOVAL_CACHE: BackgroundRemovalCache | None = None
+# Times to look a cutout up again when its cached file vanishes before it is linked
+_CACHE_LINK_ATTEMPTS = 3
 
 
 def _get_session():
     """Get or create the rembg session (singleton pattern)."""
     global _BG_REMOVAL_SESSION
     if _BG_REMOVAL_SESSION is None:
-        _BG_REMOVAL_SESSION = new_session()
+        with _SESSION_LOCK:
+            if _BG_REMOVAL_SESSION is None:
+                start = time.perf_counter()
+                _BG_REMOVAL_SESSION = new_session(REMBG_MODEL)
+                MODEL_LOAD_SECONDS.labels("rembg").set(time.perf_counter() - start)
     return _BG_REMOVAL_SESSION
 
 
+def get_pool() -> RembgProcessPool | None:
+    """Get or create the rembg process pool, or None if removals run in-process."""
+    global _BG_REMOVAL_POOL
+    if _BG_REMOVAL_POOL is None and configured_processes() > 0:
+        with _SESSION_LOCK:
+            if _BG_REMOVAL_POOL is None:
+                _BG_REMOVAL_POOL = RembgProcessPool(REMBG_MODEL)
+    return _BG_REMOVAL_POOL
+
+
+def warm_up() -> None:
+    """Load the rembg model(s) and run one small removal, so the first request pays for neither."""
+    buffer = BytesIO()
+    Image.new("RGB", (64, 64), (255, 255, 255)).save(buffer, format="PNG")
+    pool = get_pool()
+    if pool is not None:
+        pool.warm(buffer.getvalue())
+    else:
+        remove(Image.open(buffer).convert("RGB"), session=_get_session())
+
+
+def get_cache() -> BackgroundRemovalCache:
+    """Get or create the background-removal result cache (singleton pattern)."""
+    global _BG_REMOVAL_CACHE
+    if _BG_REMOVAL_CACHE is None:
+        _BG_REMOVAL_CACHE = BackgroundRemovalCache()
+    return _BG_REMOVAL_CACHE
+
+
+@timed("bg_fetch")
+def _read_image_bytes(image_path_or_url: str) -> bytes:
+    """Read the raw bytes of a local image or download them from a URL (through the shared fetch cache)."""
+    return get_fetcher().read_bytes(image_path_or_url)
+
+
+@timed("rembg")
+def _remove(image_bytes: bytes) -> Image.Image:
+    """Run rembg on encoded image bytes, on the process pool when there is one."""
+    pool = get_pool()
+    if pool is not None:
+        return pool.remove(image_bytes)
+    input_image = Image.open(BytesIO(image_bytes)).convert("RGB")
+    # Use cached session for better performance
+    return remove(input_image, session=_get_session())
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """Place src at dst, hard-linking when possible so cache hits cost no extra I/O."""
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return
+    try:
+        os.remove(dst)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+@timed("remove_background")
 def remove_background(
     image_path_or_url: str,
     output_path: str | None = None,
@@ -38,20 +125,8 @@ def remove_background(
     Returns:
         Path to the image with background removed.
     """
-    # Load image
     parsed = urlparse(image_path_or_url)
-    if parsed.scheme in ("http", "https"):
-        # Download from URL
-        response = requests.get(image_path_or_url, timeout=30)
-        response.raise_for_status()
-        input_image = Image.open(BytesIO(response.content)).convert("RGB")
-    else:
-        # Local file path
-        input_image = Image.open(image_path_or_url).convert("RGB")
-
-    # Remove background (use cached session for better performance)
-    session = _get_session()
-    output_image = remove(input_image, session=session)
+    image_bytes = _read_image_bytes(image_path_or_url)
 
     # Determine output path
     if output_path is None:
@@ -73,10 +148,56 @@ def remove_background(
 
         output_path = os.path.join(output_dir, base_name)
 
+    return _remove_to_file(image_bytes, output_path)
+
+
+@timed("remove_background")
+def remove_background_bytes(
+    image_bytes: bytes,
+    output_path: str | None = None,
+    output_dir: str = "outputs/bg_removed",
+) -> str:
+    """
+    Remove background from an image given as encoded bytes (e.g. an upload).
+
+    Args:
+        image_bytes: Encoded image (any format Pillow can read)
+        output_path: Optional output path. If None, generates a path in output_dir named after the content.
+        output_dir: Directory to save output if output_path is None.
+
+    Returns:
+        Path to the image with background removed.
+    """
+    if output_path is None:
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, hashlib.sha256(image_bytes).hexdigest()[:16] + ".png")
+    return _remove_to_file(image_bytes, output_path)
+
+
+def _remove_to_file(image_bytes: bytes, output_path: str) -> str:
+    """Write the cutout of image_bytes to output_path, going through the result cache."""
     # Ensure output directory exists
     os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else ".", exist_ok=True)
 
-    # Save result
-    output_image.save(output_path)
+    cache = get_cache()
+    if not cache.enabled:
+        _remove(image_bytes).save(output_path)
+        return output_path
+
+    # Identical inputs (e.g. catalog garments) are computed once and served from the cache
+    key = BackgroundRemovalCache.make_key(image_bytes, REMBG_MODEL)
+    for attempt in range(_CACHE_LINK_ATTEMPTS):
+        cached_path = cache.get_or_compute(key, lambda: _remove(image_bytes))
+        try:
+            with stage_timer("bg_output_link"):
+                _link_or_copy(cached_path, output_path)
+            return output_path
+        except FileNotFoundError:
+            # Evicted by another thread (or deleted) between lookup and link: look it up again
+            if attempt == _CACHE_LINK_ATTEMPTS - 1:
+                break
+            cache.discard(key)
+    # The cache keeps losing the file; do not fail a valid request over it
+    _remove(image_bytes).save(output_path)
     return output_path
 
@@ -0,0 +1,95 @@
+"""Dedicated worker lanes for blocking model work, so the event loop never runs it."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from metrics import observe_stage
+
+T = TypeVar("T")
+
+
+class ExecutorLane:
+    """
+    A named pool of worker threads fed by its own queue.
+
+    Each kind of model work gets its own lane, so a burst of one kind (e.g.
+    multi-second diffusion runs) cannot hold up another (e.g. sub-second rembg
+    calls), and the event loop stays free for health checks and stats.
+    """
+
+    def __init__(self, name: str, max_workers: int) -> None:
+        """
+        Initialize the lane.
+
+        Args:
+            name: Lane name, used for thread names, metrics and stats.
+            max_workers: Jobs run at once; anything beyond waits in the lane's queue.
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        return self._executor
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run fn(*args) on one of the lane's threads and wait for the result."""
+        enqueued_at = time.perf_counter()
+        # started / abandoned decide who takes the job out of the queued count when the caller cancels
+        state = {"started": False, "abandoned": False}
+        with self._lock:
+            self._queued += 1
+
+        def job() -> Any:
+            with self._lock:
+                if state["abandoned"]:
+                    return None
+                state["started"] = True
+                self._queued -= 1
+                self._running += 1
+            observe_stage(f"{self.name}_queue_wait", time.perf_counter() - enqueued_at)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._get_executor(), job)
+        except BaseException:
+            with self._lock:
+                if not state["started"]:
+                    state["abandoned"] = True
+                    self._queued -= 1
+                self._failed += 1
+            raise
+        with self._lock:
+            self._completed += 1
+        return result
+
+    def shutdown(self) -> None:
+        """Wait for running jobs and release the threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.max_workers,
+            "queued": self._queued,
+            "running": self._running,
+            "completed": self._completed,
+            "failed": self._failed,
+        }
@@ -0,0 +1,357 @@
+"""Shared input-image fetching: a pooled HTTP session, an on-disk cache of remote images and threaded decode."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+from urllib.parse import urlparse
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+from metrics import stage_timer
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+def is_remote(path_or_url: str) -> bool:
+    return urlparse(path_or_url).scheme in ("http", "https")
+
+
+class RemoteImageCache:
+    """
+    Disk cache of downloaded images keyed by URL.
+
+    Each entry is the response body plus a JSON sidecar with the ETag /
+    Last-Modified validators and the time until which the copy is fresh
+    (from Cache-Control max-age). Stale entries are revalidated with a
+    conditional request rather than downloaded again. Bodies are evicted
+    least-recently-used first once their total size exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir: str | None = None, max_bytes: int | None = None) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory holding cached downloads. If None, reads IMAGE_CACHE_DIR.
+            max_bytes: Disk budget in bytes; 0 disables caching. If None, reads IMAGE_CACHE_MAX_BYTES.
+        """
+        self.cache_dir = cache_dir or os.getenv("IMAGE_CACHE_DIR", os.path.join("outputs", "image_cache"))
+        if max_bytes is None:
+            max_bytes = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(1024**3)))
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> body size, oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _body_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.bin")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, url: str) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        """Return the cached (body, metadata) for url, or None."""
+        key = self.make_key(url)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(self._body_path(key), "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            # Half-written or removed behind our back: forget the entry
+            with self._lock:
+                self._remove_entry(key)
+            return None
+        return body, meta
+
+    def put(self, url: str, body: bytes, meta: Dict[str, Any]) -> None:
+        """Store a downloaded body with its validators."""
+        key = self.make_key(url)
+        suffix = f".{uuid.uuid4().hex}.tmp"
+        body_path, meta_path = self._body_path(key), self._meta_path(key)
+        with open(body_path + suffix, "wb") as f:
+            f.write(body)
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + suffix, meta_path)
+        os.replace(body_path + suffix, body_path)
+        with self._lock:
+            self._add_entry(key, len(body))
+
+    def refresh(self, url: str, meta: Dict[str, Any]) -> None:
+        """Record a successful revalidation (304): new freshness, same body."""
+        key = self.make_key(url)
+        meta_path = self._meta_path(key)
+        tmp_path = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+        try:
+            # Keep mtime in step with recency so the LRU order survives restarts
+            os.utime(self._body_path(key), None)
+        except FileNotFoundError:
+            pass
+
+    def record(self, outcome: str) -> None:
+        """Count a lookup: "hit" (served fresh), "revalidated" (304, counts as a hit) or "miss" (downloaded)."""
+        with self._lock:
+            if outcome == "miss":
+                self.misses += 1
+                return
+            self.hits += 1
+            if outcome == "revalidated":
+                self.revalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "revalidations": self.revalidations,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU index from files left by a previous process (oldest mtime first)."""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".bin"):
+                continue
+            st = os.stat(os.path.join(self.cache_dir, name))
+            files.append((st.st_mtime, name[: -len(".bin")], st.st_size))
+        for _, key, size in sorted(files):
+            self._add_entry(key, size)
+
+    def _add_entry(self, key: str, size: int) -> None:
+        # Caller holds self._lock
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._total_bytes -= previous
+        self._entries[key] = size
+        self._total_bytes += size
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            old_key = next(iter(self._entries))
+            self._remove_entry(old_key)
+            self.evictions += 1
+
+    def _remove_entry(self, key: str) -> None:
+        # Caller holds self._lock
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+        for path in (self._body_path(key), self._meta_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _cache_meta(response: requests.Response) -> Optional[Dict[str, Any]]:
+    """Validators and freshness of a response, or None if it should not be cached."""
+    cache_control = response.headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control:
+        return None
+    fresh_until = 0.0
+    match = _MAX_AGE.search(cache_control)
+    if match and "no-cache" not in cache_control:
+        fresh_until = time.time() + int(match.group(1))
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if not etag and not last_modified and not fresh_until:
+        # Could never be reused without downloading it again
+        return None
+    return {"etag": etag, "last_modified": last_modified, "fresh_until": fresh_until}
+
+
+class ImageFetcher:
+    """
+    Reads input images for inference and background removal.
+
+    Remote images are downloaded over one pooled requests.Session and kept in
+    a RemoteImageCache, so a garment URL used by many tasks is downloaded once
+    and afterwards at most revalidated. Concurrent fetches of the same URL are
+    coalesced. load_images fetches and decodes all images of a request on
+    worker threads.
+    """
+
+    def __init__(
+        self,
+        cache: RemoteImageCache | None = None,
+        max_workers: int | None = None,
+        timeout: float | None = None,
+    ) -> None:
+        """
+        Initialize the fetcher.
+
+        Args:
+            cache: Cache of remote images. If None, one is created from the IMAGE_CACHE_* env vars.
+            max_workers: Fetch/decode threads and pooled connections per host. If None, reads IMAGE_FETCH_WORKERS.
+            timeout: Per-request HTTP timeout in seconds. If None, reads IMAGE_FETCH_TIMEOUT.
+        """
+        self.cache = cache if cache is not None else RemoteImageCache()
+        self.max_workers = max_workers or int(os.getenv("IMAGE_FETCH_WORKERS", "8"))
+        self.timeout = timeout or float(os.getenv("IMAGE_FETCH_TIMEOUT", "30"))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def read_bytes(self, path_or_url: str) -> bytes:
+        """Raw bytes of a local image or a remote one (through the cache)."""
+        if not is_remote(path_or_url):
+            with open(path_or_url, "rb") as f:
+                return f.read()
+        if not self.cache.enabled:
+            return self._download(path_or_url)
+
+        with self._lock:
+            future = self._inflight.get(path_or_url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[path_or_url] = future
+        if not owner:
+            # Another thread is fetching this URL; share its result
+            return future.result()
+
+        try:
+            body = self._fetch_cached(path_or_url)
+            future.set_result(body)
+            return body
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(path_or_url, None)
+
+    def load_image(self, path_or_url: str) -> Image.Image:
+        """Load an image from either a local path or a URL, as RGB."""
+        if not is_remote(path_or_url):
+            with stage_timer("image_decode"):
+                return Image.open(path_or_url).convert("RGB")
+        data = self.read_bytes(path_or_url)
+        with stage_timer("image_decode"):
+            return Image.open(BytesIO(data)).convert("RGB")
+
+    def map(self, fn: Callable[[T], R], items: List[T]) -> List[R]:
+        """Apply fn to items on the fetch threads, preserving order (inline for a single item)."""
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        return list(self._get_executor().map(fn, items))
+
+    def load_images(self, paths: List[str]) -> List[Image.Image]:
+        """Fetch and decode several images concurrently, preserving order."""
+        return self.map(self.load_image, paths)
+
+    def stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="image-fetch")
+            return self._executor
+
+    def _download(self, url: str, headers: Dict[str, str] | None = None) -> bytes:
+        with stage_timer("image_download"):
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+            return response.content
+
+    def _fetch_cached(self, url: str) -> bytes:
+        cache = self.cache
+        cached = cache.get(url)
+        headers: Dict[str, str] = {}
+        if cached is not None:
+            body, meta = cached
+            if meta.get("fresh_until", 0) > time.time():
+                cache.record("hit")
+                return body
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with stage_timer("image_download"):
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if cached is not None and response.status_code == 304:
+            body, meta = cached
+            # A 304 may carry new freshness; keep the old validators unless it sends new ones
+            refreshed = _cache_meta(response) or {}
+            meta = {
+                "url": url,
+                "etag": refreshed.get("etag") or meta.get("etag"),
+                "last_modified": refreshed.get("last_modified") or meta.get("last_modified"),
+                "fresh_until": refreshed.get("fresh_until", 0.0),
+            }
+            cache.refresh(url, meta)
+            cache.record("revalidated")
+            return body
+
+        response.raise_for_status()
+        body = response.content
+        cache.record("miss")
+        meta = _cache_meta(response)
+        if meta is not None:
+            meta["url"] = url
+            cache.put(url, body, meta)
+        return body
+
+
+_FETCHER: ImageFetcher | None = None
+_FETCHER_LOCK = threading.Lock()
+
+
+def get_fetcher() -> ImageFetcher:
+    """Get or create the shared image fetcher (singleton pattern)."""
+    global _FETCHER
+    if _FETCHER is None:
+        with _FETCHER_LOCK:
+            if _FETCHER is None:
+                _FETCHER = ImageFetcher()
+    return _FETCHER
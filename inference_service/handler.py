@@ -15,7 +15,13 @@ Infer task (default task_type is "infer"):
     "width": 1024,                       # optional
     "guidance_scale": 1.0,              # optional
     "num_inference_steps": 10,          # optional
-    "remove_background": [false, true]  # optional, per-image flags
+    "seed": 42,                         # optional
+    "output_format": "webp",            # optional: png | webp | jpeg (default OUTPUT_FORMAT)
+    "output_quality": 90,               # optional: JPEG / lossy WebP quality
+    "png_compress_level": 6,            # optional: PNG zlib level 0-9
+    "webp_lossless": false,             # optional
+    "remove_background": [false, true], # optional, per-image flags
+    "profile": false                    # optional: store a profile under PROFILE_DIR/<job id>
   }
 }
 
@@ -35,23 +41,45 @@ Background-removal-only task:
 Both task types return:
 {
   "success": true,
-  "image_base64": "<PNG as base64>",
+  "image_base64": "<image as base64>",
+  "image_format": "png",
+  "error_message": null
+}
+
+Batch background-removal task (items run concurrently on the rembg workers):
+{
+  "input": {
+    "task_type": "remove_background_batch",
+    "items": [{"image_path": "person.png"}, {"image_base64": "<image as base64>"}],
+    "output_format": "webp"             # optional, as above
+  }
+}
+
+It returns one result per item, in order; a failing item does not fail the others:
+{
+  "success": true,
+  "results": [{"success": true, "image_base64": "...", "image_format": "webp", "error_message": null}, ...],
   "error_message": null
 }
 """
 
 from __future__ import annotations
 
-from io import BytesIO
 from typing import Any, Dict, List
 
 import base64
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import runpod
 
-from bg_removal.remover import remove_background
+from bg_removal.pool import configured_processes
+from bg_removal.remover import remove_background, remove_background_bytes
+from encoding import EncodeOptions, encode_image, resolve_options
 from infer import run_inference
+from profiling import InferenceProfiler
+from warmup import Readiness, eager_load_enabled, run_startup
 
 
 def _bool_flags_for_images(
@@ -83,16 +111,26 @@ def _bool_flags_for_images(
     return [False] * n
 
 
-def _encode_image_file_to_base64(path: str) -> str:
-    """Read an image file and return PNG base64 string."""
+def _encode_options(job_input: Dict[str, Any]) -> EncodeOptions:
+    """Per-job output encoding on top of the deployment defaults (OUTPUT_FORMAT etc.)."""
+    quality = job_input.get("output_quality")
+    level = job_input.get("png_compress_level")
+    lossless = job_input.get("webp_lossless")
+    return resolve_options(
+        output_format=job_input.get("output_format"),
+        quality=int(quality) if quality is not None else None,
+        png_compress_level=int(level) if level is not None else None,
+        webp_lossless=bool(lossless) if lossless is not None else None,
+    )
+
+
+def _encode_image_file_to_base64(path: str, options: EncodeOptions) -> str:
+    """Read an image file and return it re-encoded with options as a base64 string."""
     from PIL import Image  # local import to avoid unnecessary dependency at import time
 
     with Image.open(path) as img:
         img = img.convert("RGB")
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
-        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+        return base64.b64encode(encode_image(img, options)).decode("utf-8")
 
 
 def _handle_infer(job_input: Dict[str, Any], job_id: str) -> Dict[str, Any]:
@@ -111,6 +149,8 @@ def _handle_infer(job_input: Dict[str, Any], job_id: str) -> Dict[str, Any]:
     width = int(job_input.get("width", 1024))
     guidance_scale = float(job_input.get("guidance_scale", 1.0))
     num_inference_steps = int(job_input.get("num_inference_steps", 10))
+    seed = job_input.get("seed")
+    seed = int(seed) if seed is not None else None
 
     # Per-image background removal flags
     remove_background_param = job_input.get("remove_background")
@@ -130,8 +170,10 @@ def _handle_infer(job_input: Dict[str, Any], job_id: str) -> Dict[str, Any]:
         else:
             processed_paths.append(path)
 
+    profiler = InferenceProfiler(job_id) if job_input.get("profile") else None
     try:
-        # run_inference already returns base64-encoded PNG string
+        encode_options = _encode_options(job_input)
+        # run_inference already returns the base64-encoded image
         image_base64 = run_inference(
             prompt=prompt,
             image_paths=processed_paths,
@@ -140,10 +182,15 @@ def _handle_infer(job_input: Dict[str, Any], job_id: str) -> Dict[str, Any]:
             guidance_scale=guidance_scale,
             num_inference_steps=num_inference_steps,
             output_path=None,
+            seed=seed,
+            encode_options=encode_options,
+            profiler=profiler,
         )
         return {
             "success": True,
             "image_base64": image_base64,
+            "image_format": encode_options.format,
+            "profile": profiler.summary if profiler is not None else None,
             "error_message": None,
         }
     except Exception as exc:  # noqa: BLE001
@@ -169,11 +216,13 @@ def _handle_remove_background(job_input: Dict[str, Any], job_id: str) -> Dict[st
     output_path = os.path.join(tmp_dir, "removed.png")
 
     try:
+        encode_options = _encode_options(job_input)
         processed_path = remove_background(image_path_or_url=image_path, output_path=output_path)
-        image_base64 = _encode_image_file_to_base64(processed_path)
+        image_base64 = _encode_image_file_to_base64(processed_path, encode_options)
         return {
             "success": True,
             "image_base64": image_base64,
+            "image_format": encode_options.format,
             "error_message": None,
         }
     except Exception as exc:  # noqa: BLE001
@@ -184,6 +233,49 @@ def _handle_remove_background(job_input: Dict[str, Any], job_id: str) -> Dict[st
         }
 
 
+def _handle_remove_background_batch(job_input: Dict[str, Any], job_id: str) -> Dict[str, Any]:
+    """Handle the 'remove_background_batch' task_type."""
+    items = job_input.get("items")
+    if not isinstance(items, list) or not items:
+        return {
+            "success": False,
+            "results": [],
+            "error_message": "'items' must be a non-empty list for remove_background_batch task.",
+        }
+
+    tmp_dir = os.path.join("/tmp", "bg_removed", job_id)
+    os.makedirs(tmp_dir, exist_ok=True)
+    try:
+        encode_options = _encode_options(job_input)
+    except Exception as exc:  # noqa: BLE001
+        return {"success": False, "results": [], "error_message": str(exc)}
+
+    def _process(index: int, item: Any) -> Dict[str, Any]:
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Each item must be an object with image_path or image_base64")
+            output_path = os.path.join(tmp_dir, f"removed_{index}.png")
+            if item.get("image_base64"):
+                processed_path = remove_background_bytes(base64.b64decode(item["image_base64"]), output_path)
+            elif item.get("image_path"):
+                processed_path = remove_background(image_path_or_url=item["image_path"], output_path=output_path)
+            else:
+                raise ValueError("Either image_path or image_base64 is required")
+            return {
+                "success": True,
+                "image_base64": _encode_image_file_to_base64(processed_path, encode_options),
+                "image_format": encode_options.format,
+                "error_message": None,
+            }
+        except Exception as exc:  # noqa: BLE001
+            return {"success": False, "image_base64": None, "error_message": str(exc)}
+
+    # One thread per rembg worker process keeps the whole pool busy
+    with ThreadPoolExecutor(max_workers=min(len(items), max(2, configured_processes()))) as executor:
+        results = list(executor.map(_process, range(len(items)), items))
+    return {"success": True, "results": results, "error_message": None}
+
+
 def handler(job: Dict[str, Any]) -> Dict[str, Any]:
     """Runpod serverless handler.
 
@@ -202,6 +294,8 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
         return _handle_infer(job_input, job_id)
     if task_type == "remove_background":
         return _handle_remove_background(job_input, job_id)
+    if task_type == "remove_background_batch":
+        return _handle_remove_background_batch(job_input, job_id)
 
     return {
         "success": False,
@@ -210,6 +304,12 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-runpod.serverless.start({"handler": handler})
+# Guarded so the rembg pool's spawned workers, which re-import this module, do not start workers of their own
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if eager_load_enabled():
+        # Load and warm before taking jobs, so the first job does not pay for it
+        run_startup(Readiness(required=True))
+    runpod.serverless.start({"handler": handler})
 
 
@@ -2,61 +2,460 @@
 
 from __future__ import annotations
 
+import contextlib
+import functools
+import inspect
+import logging
 import os
-from io import BytesIO
-from typing import List
-from urllib.parse import urlparse
+import threading
+import time
+from typing import Any, Callable, List, Tuple
 
 import base64
-import requests
 import torch
 import sys
 from pathlib import Path
 
-# Add diffusers to path
+# Add diffusers to path (the vendored checkout the Dockerfile also installs; see DIFFUSERS_VERSION)
 sys.path.insert(0, str(Path(__file__).parent / "diffusers" / "src"))
 
+import diffusers
 from diffusers import Flux2KleinPipeline
 from PIL import Image
 
+from encoding import EncodeOptions, default_options, encode_image
+from fetch import get_fetcher
+from latent_cache import LatentCache
+from metrics import MODEL_LOAD_SECONDS, observe_stage, stage_timer, timed
+from preprocess import load_reference_image, reference_max_pixels
+from profiling import InferenceProfiler
+from prompt_cache import PromptEmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+# Model path relative to inference_service directory
+MODEL_PATH = Path(__file__).parent / "flux2-klein" / "FLUX.2-klein-4B"
+
+# diffusers release whose pipeline internals the latent cache hook was written against
+DIFFUSERS_VERSION = "0.37.0"
+
 _PIPELINE = None
 
+# Seconds spent in instrumented sub-stages during the current pipeline call, per thread
+_SUBSTAGES = threading.local()
+
+# Text-encoder outputs for repeated prompts (created on first use)
+_PROMPT_CACHE: PromptEmbeddingCache | None = None
+
+# VAE latents of repeated reference images (created on first use)
+_LATENT_CACHE: LatentCache | None = None
+
+# Content keys of the current pipeline call's reference images, taken in order by the VAE encode hook, per thread
+_REFERENCE_KEYS = threading.local()
+
+# Whether the loaded pipeline passed the latent cache's checks (see _install_latent_cache)
+_LATENT_CACHE_USABLE = False
+
+# Whether the loaded pipeline can take cached prompt embeddings (see _check_prompt_embeds)
+_PROMPT_EMBEDS_USABLE = False
+
 
 def _get_device() -> str:
     """Get the device to run inference on."""
     return "cuda" if torch.cuda.is_available() else "cpu"
 
 
+def _synchronize() -> None:
+    """Wait for queued GPU work so stage timings measure execution, not just kernel launches."""
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def _timed_substage(fn: Callable[..., Any], stage: str) -> Callable[..., Any]:
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _synchronize()
+            elapsed = time.perf_counter() - start
+            observe_stage(stage, elapsed)
+            _SUBSTAGES.seconds = getattr(_SUBSTAGES, "seconds", 0.0) + elapsed
+
+    return wrapper
+
+
+def _instrument_pipeline(pipe: Flux2KleinPipeline) -> None:
+    """Time the text encoder and VAE calls the pipeline makes internally."""
+    if hasattr(pipe, "encode_prompt"):
+        pipe.encode_prompt = _timed_substage(pipe.encode_prompt, "text_encode")
+    vae = getattr(pipe, "vae", None)
+    for method, stage in (("encode", "vae_encode"), ("decode", "vae_decode")):
+        if vae is not None and hasattr(vae, method):
+            setattr(vae, method, _timed_substage(getattr(vae, method), stage))
+
+
+def _probe_reference_encodes(pipe: Flux2KleinPipeline, encode: Callable[..., Any]) -> str | None:
+    """
+    Check what the latent cache assumes about the pipeline with one tiny generation.
+
+    The pipeline must call encode once per reference image, one image at a
+    time, in the order the images were passed, and encoding the same image
+    twice must give the same latent.
+
+    Returns:
+        Why the cache cannot be used, or None if every check passed.
+    """
+    calls: List[Tuple[Tuple[int, ...], bool]] = []
+
+    def recording_encode(*args: Any, **kwargs: Any) -> Any:
+        latent = encode(*args, **kwargs)
+        image = kwargs.get("image", args[0] if args else None)
+        shape = tuple(image.shape) if isinstance(image, torch.Tensor) else ()
+        calls.append((shape, torch.equal(latent, encode(*args, **kwargs))))
+        return latent
+
+    # A wide and a tall reference, so the recorded shapes show both the count and the order of the encodes
+    images = [Image.new("RGB", (64, 32), (255, 0, 0)), Image.new("RGB", (32, 64), (0, 0, 255))]
+    pipe._encode_vae_image = recording_encode
+    try:
+        with torch.no_grad():
+            pipe(prompt="latent cache check", image=images, height=64, width=64, guidance_scale=1.0, num_inference_steps=1)
+    finally:
+        pipe._encode_vae_image = encode
+
+    if len(calls) != len(images):
+        return f"{len(calls)} VAE encodes for {len(images)} reference images"
+    shapes = [shape for shape, _ in calls]
+    if any(len(shape) != 4 or shape[0] != 1 for shape in shapes):
+        return f"reference images encoded as {shapes}, not one at a time"
+    if not (shapes[0][-1] > shapes[0][-2] and shapes[1][-1] < shapes[1][-2]):
+        return "reference images not encoded in the order they were passed"
+    if not all(deterministic for _, deterministic in calls):
+        return "VAE encode is not deterministic"
+    return None
+
+
+def _install_latent_cache(pipe: Flux2KleinPipeline) -> None:
+    """
+    Route the pipeline's per-image VAE encode through the latent cache.
+
+    This wraps the private _encode_vae_image of diffusers DIFFUSERS_VERSION and
+    stays off with any other version. That pipeline encodes reference images
+    one at a time, in the order they were passed, so each call takes the next
+    key _generate queued for the call. _probe_reference_encodes checks this once at load time
+    and the cache stays off if it does not hold. If a call still looks
+    different (no keys left, a batched tensor), it and the rest of the pipeline
+    call encode normally, so a latent is never paired with the wrong image.
+    """
+    global _LATENT_CACHE_USABLE
+    if not get_latent_cache().enabled:
+        return
+    encode = getattr(pipe, "_encode_vae_image", None)
+    if encode is None:
+        logger.warning("Latent cache disabled: pipeline has no _encode_vae_image")
+        return
+    # Whichever diffusers won the import (vendored checkout or installed package) must be the expected release
+    if diffusers.__version__.split(".dev")[0] != DIFFUSERS_VERSION:
+        logger.warning(
+            "Latent cache disabled: diffusers %s loaded from %s, the hook is written against %s",
+            diffusers.__version__,
+            os.path.dirname(diffusers.__file__),
+            DIFFUSERS_VERSION,
+        )
+        return
+    try:
+        problem = _probe_reference_encodes(pipe, encode)
+    except Exception as exc:  # noqa: BLE001
+        problem = f"check failed: {exc}"
+    if problem is not None:
+        logger.warning("Latent cache disabled: %s", problem)
+        return
+
+    @functools.wraps(encode)
+    def cached_encode(*args: Any, **kwargs: Any) -> Any:
+        keys = getattr(_REFERENCE_KEYS, "keys", None)
+        image = kwargs.get("image", args[0] if args else None)
+        if not keys or not isinstance(image, torch.Tensor) or image.ndim != 4 or image.shape[0] != 1:
+            _REFERENCE_KEYS.keys = None
+            return encode(*args, **kwargs)
+        key = (keys.pop(0), tuple(image.shape[-2:]))
+        return get_latent_cache().get_or_encode(key, lambda: encode(*args, **kwargs), image.device)
+
+    pipe._encode_vae_image = cached_encode
+    _LATENT_CACHE_USABLE = True
+
+
+def _disable_latent_cache(reason: str) -> None:
+    """Stop using the latent cache for the rest of the process (a pipeline call broke its assumptions)."""
+    global _LATENT_CACHE_USABLE
+    if _LATENT_CACHE_USABLE:
+        _LATENT_CACHE_USABLE = False
+        get_latent_cache().clear()
+        logger.warning("Latent cache disabled: %s", reason)
+
+
+def _check_prompt_embeds(pipe: Flux2KleinPipeline) -> None:
+    """
+    Decide once, at load time, whether _encode_prompts may pass cached prompt embeddings.
+
+    The cache stores only the embeddings and drops the text_ids that
+    encode_prompt also returns. That is only correct if the pipeline takes
+    prompt_embeds without text_ids and rebuilds identical ids from the
+    embeddings, as diffusers DIFFUSERS_VERSION does; this checks it
+    with one short prompt.
+    """
+    global _PROMPT_EMBEDS_USABLE
+    if not get_prompt_cache().enabled or not hasattr(pipe, "encode_prompt"):
+        return
+    parameters = inspect.signature(pipe.__call__).parameters
+    if "prompt_embeds" not in parameters:
+        logger.warning("Prompt embedding cache disabled: pipeline does not accept prompt_embeds")
+        return
+    if "text_ids" in parameters:
+        logger.warning("Prompt embedding cache disabled: pipeline expects text_ids alongside prompt_embeds")
+        return
+    try:
+        device = _get_device()
+        with torch.no_grad():
+            embeds, text_ids = pipe.encode_prompt(prompt="prompt cache check", device=device, num_images_per_prompt=1)
+            _, rebuilt_ids = pipe.encode_prompt(
+                prompt=None, prompt_embeds=embeds, device=device, num_images_per_prompt=1
+            )
+        if not torch.equal(text_ids, rebuilt_ids):
+            logger.warning("Prompt embedding cache disabled: pipeline does not rebuild text_ids from prompt_embeds")
+            return
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("Prompt embedding cache disabled: check failed: %s", exc)
+        return
+    _PROMPT_EMBEDS_USABLE = True
+
+
 def _load_pipeline() -> Flux2KleinPipeline:
     """Load the Flux2KleinPipeline model (lazy loading, singleton)."""
     global _PIPELINE
     if _PIPELINE is None:
+        start = time.perf_counter()
         device = _get_device()
         dtype = torch.bfloat16 if device == "cuda" else torch.float16
-        # Model path relative to inference_service directory
-        model_path = Path(__file__).parent / "flux2-klein" / "FLUX.2-klein-4B"
-        _PIPELINE = Flux2KleinPipeline.from_pretrained(
-            str(model_path),
+        pipe = Flux2KleinPipeline.from_pretrained(
+            str(MODEL_PATH),
             torch_dtype=dtype,
         )
-        _PIPELINE.to(device)
+        pipe.to(device)
+        _instrument_pipeline(pipe)
+        MODEL_LOAD_SECONDS.labels("pipeline").set(time.perf_counter() - start)
+        _check_prompt_embeds(pipe)
+        _install_latent_cache(pipe)
+        _PIPELINE = pipe
     return _PIPELINE
 
 
-def _load_image(path_or_url: str) -> Image.Image:
+def load_pipeline() -> None:
+    """Load the pipeline now (e.g. at startup) instead of on the first request."""
+    _load_pipeline()
+
+
+def get_prompt_cache() -> PromptEmbeddingCache:
+    """Get or create the prompt embedding cache (singleton pattern)."""
+    global _PROMPT_CACHE
+    if _PROMPT_CACHE is None:
+        # The model directory name stands in for the revision unless MODEL_REVISION is set
+        _PROMPT_CACHE = PromptEmbeddingCache(revision=os.getenv("MODEL_REVISION", MODEL_PATH.name))
+    return _PROMPT_CACHE
+
+
+def get_latent_cache() -> LatentCache:
+    """Get or create the reference-image latent cache (singleton pattern)."""
+    global _LATENT_CACHE
+    if _LATENT_CACHE is None:
+        _LATENT_CACHE = LatentCache(revision=os.getenv("MODEL_REVISION", MODEL_PATH.name))
+    return _LATENT_CACHE
+
+
+def _encode_prompts(pipe: Flux2KleinPipeline, prompts: List[str]) -> torch.Tensor | None:
+    """
+    Return the batched prompt embeddings for prompts, from the cache when possible.
+
+    Returns None when caching is disabled or the pipeline cannot take
+    precomputed embeddings (see _check_prompt_embeds), in which case the raw
+    prompts should be passed.
+    """
+    cache = get_prompt_cache()
+    if not cache.enabled or not _PROMPT_EMBEDS_USABLE:
+        return None
+
+    device = _get_device()
+
+    def encoder(prompt: str) -> Callable[[], torch.Tensor]:
+        def encode() -> torch.Tensor:
+            with torch.no_grad():
+                encoded = pipe.encode_prompt(prompt=prompt, device=device, num_images_per_prompt=1)
+            # encode_prompt returns (prompt_embeds, text_ids); the pipeline rebuilds the ids (checked at load)
+            return encoded[0] if isinstance(encoded, tuple) else encoded
+
+        return encode
+
+    embeds = [cache.get_or_encode(prompt, encoder(prompt), device) for prompt in prompts]
+    if len(embeds) == 1:
+        return embeds[0]
+    if len({tuple(e.shape[1:]) for e in embeds}) != 1:
+        # Unpadded encoders can yield different lengths; let the pipeline encode the batch itself
+        return None
+    return torch.cat(embeds, dim=0)
+
+
+@timed("load_image")
+def _load_image(path_or_url: str) -> Tuple[Image.Image, str]:
+    """
+    Load a reference image from either a local path or a URL (remote images go through the shared fetch cache),
+    decoded at reduced resolution near the size the pipeline scales it to, plus its content hash.
+    """
+    return load_reference_image(path_or_url)
+
+
+def generate_image(
+    prompt: str,
+    image_paths: List[str],
+    height: int = 1024,
+    width: int = 1024,
+    guidance_scale: float = 1.0,
+    num_inference_steps: int = 10,
+    seed: int | None = None,
+    profiler: InferenceProfiler | None = None,
+) -> Image.Image:
+    """
+    Run the pipeline with the given prompt and images.
+
+    Args:
+        prompt: Text prompt for generation
+        image_paths: List of image paths (first is person/base, rest are accessories)
+        height: Output image height
+        width: Output image width
+        guidance_scale: Guidance scale
+        num_inference_steps: Number of inference steps
+        seed: Optional random seed. If None, generation is not reproducible.
+        profiler: Optional profiler wrapped around image loading and the pipeline call.
+
+    Returns:
+        The generated image.
     """
-    Load an image from either a local path or a URL.
+    with profiler or contextlib.nullcontext():
+        return _generate([prompt], image_paths, height, width, guidance_scale, num_inference_steps, [seed])[0]
+
+
+def generate_batch(
+    prompts: List[str],
+    image_paths: List[str],
+    height: int = 1024,
+    width: int = 1024,
+    guidance_scale: float = 1.0,
+    num_inference_steps: int = 10,
+    seeds: List[int | None] | None = None,
+) -> List[Image.Image]:
     """
-    parsed = urlparse(path_or_url)
-    if parsed.scheme in ("http", "https"):
-        # Download from URL
-        response = requests.get(path_or_url, timeout=30)
-        response.raise_for_status()
-        img = Image.open(BytesIO(response.content)).convert("RGB")
+    Generate one image per prompt in a single batched pipeline call.
+
+    All prompts are conditioned on the same reference images, matching how the
+    pipeline shares its image inputs across a batch.
+
+    Args:
+        prompts: Text prompts, one per output image
+        image_paths: Reference image paths shared by the whole batch
+        height: Output image height
+        width: Output image width
+        guidance_scale: Guidance scale
+        num_inference_steps: Number of inference steps
+        seeds: Optional per-prompt seeds (None entries are random).
+
+    Returns:
+        The generated images, in prompt order.
+    """
+    return _generate(
+        prompts, image_paths, height, width, guidance_scale, num_inference_steps, seeds or [None] * len(prompts)
+    )
+
+
+def _generator(seed: int | None) -> torch.Generator:
+    generator = torch.Generator(device=_get_device())
+    if seed is None:
+        generator.seed()
     else:
-        # Local file path
-        img = Image.open(path_or_url).convert("RGB")
-    return img
+        generator.manual_seed(seed)
+    return generator
+
+
+def _generate(
+    prompts: List[str],
+    image_paths: List[str],
+    height: int,
+    width: int,
+    guidance_scale: float,
+    num_inference_steps: int,
+    seeds: List[int | None],
+) -> List[Image.Image]:
+    pipe = _load_pipeline()
+
+    # Fetch and decode all images concurrently
+    loaded = get_fetcher().map(_load_image, image_paths)
+    images: List[Image.Image] = [image for image, _ in loaded]
+
+    generator = None
+    if len(prompts) > 1:
+        # One generator per image keeps seeded results identical to unbatched runs
+        generator = [_generator(seed) for seed in seeds]
+    elif seeds[0] is not None:
+        generator = _generator(seeds[0])
+
+    # Templated prompts repeat a lot; reuse their text-encoder output when cached
+    prompt_embeds = _encode_prompts(pipe, prompts)
+    if prompt_embeds is not None:
+        prompt_kwargs = {"prompt_embeds": prompt_embeds}
+    else:
+        prompt_kwargs = {"prompt": prompts[0] if len(prompts) == 1 else prompts}
+
+    # Repeated person / garment images reuse their VAE latents (see _install_latent_cache)
+    if _LATENT_CACHE_USABLE:
+        max_pixels = reference_max_pixels()
+        _REFERENCE_KEYS.keys = [(digest, max_pixels) for _, digest in loaded]
+
+    # Run inference
+    _SUBSTAGES.seconds = 0.0
+    start = time.perf_counter()
+    try:
+        result = pipe(
+            **prompt_kwargs,
+            image=images,
+            height=height,
+            width=width,
+            guidance_scale=guidance_scale,
+            num_inference_steps=num_inference_steps,
+            generator=generator,
+        ).images
+    finally:
+        unused_keys = getattr(_REFERENCE_KEYS, "keys", None)
+        _REFERENCE_KEYS.keys = None
+    if unused_keys:
+        # Fewer encodes than reference images: the pairing of keys and images cannot be trusted
+        _disable_latent_cache(f"{len(unused_keys)} of {len(images)} reference images were not encoded")
+    elapsed = time.perf_counter() - start
+    observe_stage("pipeline", elapsed)
+    # Whatever is not text encoding or VAE work is the denoising loop (plus small pre/post-processing)
+    observe_stage("denoise", max(elapsed - _SUBSTAGES.seconds, 0.0))
+    return list(result[: len(prompts)])
+
+
+def write_image_file(image_bytes: bytes, output_path: str) -> str:
+    """Atomically write encoded image bytes to output_path (e.g. on a shared volume or /dev/shm)."""
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(image_bytes)
+    os.replace(tmp_path, output_path)
+    return output_path
 
 
 def run_inference(
@@ -67,6 +466,9 @@ def run_inference(
     guidance_scale: float = 1.0,
     num_inference_steps: int = 10,
     output_path: str | None = None,
+    seed: int | None = None,
+    encode_options: EncodeOptions | None = None,
+    profiler: InferenceProfiler | None = None,
 ) -> str:
     """
     Run inference with the given prompt and images.
@@ -78,36 +480,30 @@ def run_inference(
         width: Output image width
         guidance_scale: Guidance scale
         num_inference_steps: Number of inference steps
-        output_path: Optional output path. If None, generates a temporary path.
+        output_path: Optional output path. If given, the encoded image is also written there.
+        seed: Optional random seed. If None, generation is not reproducible.
+        encode_options: Output encoding. If None, uses the deployment defaults (OUTPUT_FORMAT etc.).
+        profiler: Optional profiler wrapped around the generation; artifacts land in its output_dir.
 
     Returns:
-        Path to the generated image.
+        The generated image, encoded and base64-encoded.
     """
-    pipe = _load_pipeline()
-
-    # Load all images
-    images: List[Image.Image] = []
-    for path in image_paths:
-        img = _load_image(path)
-        images.append(img)
-
-    # Run inference
-    result = pipe(
+    result = generate_image(
         prompt=prompt,
-        image=images,
+        image_paths=image_paths,
         height=height,
         width=width,
         guidance_scale=guidance_scale,
         num_inference_steps=num_inference_steps,
-    ).images[0]
-
-    # Encode result as base64 (PNG)
-    buffer = BytesIO()
-    result.save(buffer, format="PNG")
-    buffer.seek(0)
-
-    image_bytes = buffer.getvalue()
-    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-
-    return image_base64
+        seed=seed,
+        profiler=profiler,
+    )
 
+    # Encode result (PNG by default) as base64
+    with stage_timer("encode_image"):
+        image_bytes = encode_image(result, encode_options or default_options())
+    if output_path is not None:
+        with stage_timer("write_file"):
+            write_image_file(image_bytes, output_path)
+    with stage_timer("base64"):
+        return base64.b64encode(image_bytes).decode("utf-8")
@@ -0,0 +1,161 @@
+"""Two-tier LRU cache of VAE latents for repeated reference images."""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+
+class LatentCache:
+    """
+    Bounded cache of encoded reference-image latents, in device memory with spill to host memory.
+
+    Keys combine the model revision, the image's content hash and the
+    resolution it was encoded at. New and recently used latents live on the
+    inference device; when the device budget is exceeded the least recently
+    used ones are moved to host memory, and host entries beyond the host budget
+    are dropped. A host hit is copied back to the device and promoted.
+
+    Only valid for deterministic encoders: the Flux.2 pipelines take the mode of
+    the VAE posterior, so a cached latent equals a fresh encode (infer.py checks
+    this when it loads the pipeline). Callers get a copy of the cached tensor, so
+    modifying it in place cannot corrupt the cache.
+    """
+
+    def __init__(
+        self,
+        max_device_bytes: int | None = None,
+        max_host_bytes: int | None = None,
+        revision: str | None = None,
+    ) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            max_device_bytes: Budget on the inference device. If None, reads LATENT_CACHE_DEVICE_BYTES.
+            max_host_bytes: Budget in host memory for spilled latents. If None, reads LATENT_CACHE_HOST_BYTES.
+                Both budgets 0 disables caching.
+            revision: Model / VAE revision, part of every key. If None, reads MODEL_REVISION.
+        """
+        if max_device_bytes is None:
+            max_device_bytes = int(os.getenv("LATENT_CACHE_DEVICE_BYTES", str(256 * 1024**2)))
+        if max_host_bytes is None:
+            max_host_bytes = int(os.getenv("LATENT_CACHE_HOST_BYTES", str(1024**3)))
+        self.max_device_bytes = max_device_bytes
+        self.max_host_bytes = max_host_bytes
+        self.revision = revision or os.getenv("MODEL_REVISION", "default")
+
+        self._device: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._host: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._device_bytes = 0
+        self._host_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.host_hits = 0
+        self.misses = 0
+        self.spills = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_device_bytes > 0 or self.max_host_bytes > 0
+
+    def get_or_encode(self, key: Hashable, encode: Callable[[], Any], device: Any) -> Any:
+        """
+        Return the latent tensor for key on device, running encode() on a miss.
+
+        Args:
+            key: Content hash and resolution of the reference image (the revision is added here).
+            encode: Runs the VAE and returns the latent tensor.
+            device: Device the pipeline runs on.
+
+        Returns:
+            The latent tensor (a copy; the cached one is never handed out).
+        """
+        key = (self.revision, key)
+        with self._lock:
+            latent = self._device.get(key)
+            if latent is not None:
+                self._device.move_to_end(key)
+                self.hits += 1
+                return latent.clone()
+            latent = self._host.pop(key, None)
+            if latent is not None:
+                self._host_bytes -= _nbytes(latent)
+                self.hits += 1
+                self.host_hits += 1
+            else:
+                self.misses += 1
+
+        if latent is not None:
+            # Promote back to the device tier
+            latent = latent.to(device, non_blocking=True)
+        else:
+            # Two threads missing the same image both encode it; the second insert just replaces the first
+            latent = encode()
+        self._insert(key, latent)
+        return latent.clone()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._device.clear()
+            self._host.clear()
+            self._device_bytes = 0
+            self._host_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "device_entries": len(self._device),
+                "host_entries": len(self._host),
+                "device_bytes": self._device_bytes,
+                "host_bytes": self._host_bytes,
+                "bytes": self._device_bytes + self._host_bytes,
+                "hits": self.hits,
+                "host_hits": self.host_hits,
+                "misses": self.misses,
+                "spills": self.spills,
+                "evictions": self.evictions,
+            }
+
+    def _insert(self, key: Hashable, latent: Any) -> None:
+        spilled = []
+        with self._lock:
+            previous = self._device.pop(key, None)
+            if previous is not None:
+                self._device_bytes -= _nbytes(previous)
+            self._device[key] = latent
+            self._device_bytes += _nbytes(latent)
+            while self._device_bytes > self.max_device_bytes and self._device:
+                old_key, old = self._device.popitem(last=False)
+                self._device_bytes -= _nbytes(old)
+                spilled.append((old_key, old))
+
+        # Device-to-host copies happen outside the lock
+        for old_key, old in spilled:
+            size = _nbytes(old)
+            if size > self.max_host_bytes:
+                with self._lock:
+                    self.evictions += 1
+                continue
+            host = old.to("cpu")
+            with self._lock:
+                if old_key in self._device:
+                    # Re-inserted on the device while we were copying
+                    continue
+                previous = self._host.pop(old_key, None)
+                if previous is not None:
+                    self._host_bytes -= _nbytes(previous)
+                self.spills += 1
+                self._host[old_key] = host
+                self._host_bytes += size
+                while self._host_bytes > self.max_host_bytes:
+                    _, dropped = self._host.popitem(last=False)
+                    self._host_bytes -= _nbytes(dropped)
+                    self.evictions += 1
+
+
+def _nbytes(tensor: Any) -> int:
+    return tensor.element_size() * tensor.nelement()
@@ -2,37 +2,246 @@
 
 from __future__ import annotations
 
+import asyncio
+import base64
+import logging
 import os
+from contextlib import asynccontextmanager
+from typing import List, Optional, Union
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, Response
+from fastapi.responses import JSONResponse
 
-from bg_removal.models import BackgroundRemovalRequest, BackgroundRemovalResponse
-from bg_removal.remover import remove_background
-from infer import run_inference
-from models import InferenceRequest, InferenceResponse
+from PIL import Image
 
-app = FastAPI(title="OOTD Inference Service", version="0.1.0")
+from batching import GenerationJob, MicroBatcher
+from executors import ExecutorLane
+from bg_removal.models import (
+    BackgroundRemovalBatchRequest,
+    BackgroundRemovalBatchResponse,
+    BackgroundRemovalItem,
+    BackgroundRemovalRequest,
+    BackgroundRemovalResponse,
+)
+from bg_removal.pool import configured_processes
+from bg_removal.remover import get_cache, get_pool, remove_background, remove_background_bytes
+from bg_removal.remover import warm_up as warm_background_removal
+from encoding import encode_image, resolve_options
+from fetch import get_fetcher
+from infer import generate_batch, generate_image, get_latent_cache, get_prompt_cache, load_pipeline, write_image_file
+from metrics import CONTENT_TYPE_LATEST, IN_PROGRESS, render as render_metrics, stage_timer
+from models import InferenceBatchRequest, InferenceBatchResponse, InferenceRequest, InferenceResponse
+from preprocess import content_digests, get_reference_cache
+from profiling import InferenceProfiler
+from warmup import Readiness, eager_load_enabled, warm_generation, warmup_resolutions, warmup_steps
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+def _run_generation_batch(jobs: List[GenerationJob]) -> List[Image.Image]:
+    """Run a group of compatible jobs as one pipeline call (on the generation lane)."""
+    first = jobs[0]
+    if first.profiler is not None:
+        return [
+            generate_image(
+                prompt=first.prompt,
+                image_paths=first.image_paths,
+                height=first.height,
+                width=first.width,
+                guidance_scale=first.guidance_scale,
+                num_inference_steps=first.num_inference_steps,
+                seed=first.seed,
+                profiler=first.profiler,
+            )
+        ]
+    return generate_batch(
+        prompts=[job.prompt for job in jobs],
+        image_paths=first.image_paths,
+        height=first.height,
+        width=first.width,
+        guidance_scale=first.guidance_scale,
+        num_inference_steps=first.num_inference_steps,
+        seeds=[job.seed for job in jobs],
+    )
+
+
+# Model work never runs on the event loop. Generation gets a single thread (one pipeline call
+# at a time on the GPU); background removal has its own lane so rembg jobs never queue
+# behind diffusion runs. By default the bg lane has one thread per rembg worker process,
+# enough to keep the whole pool busy.
+generation_lane = ExecutorLane("generation", max_workers=1)
+bg_removal_lane = ExecutorLane(
+    "bg_removal", max_workers=int(os.getenv("BG_REMOVAL_WORKERS", "0")) or max(2, configured_processes())
+)
+batcher = MicroBatcher(_run_generation_batch, generation_lane)
+
+
+def _queue_stats() -> dict:
+    stats = {
+        "generation": generation_lane.stats(),
+        "bg_removal": bg_removal_lane.stats(),
+        "batcher": batcher.stats(),
+    }
+    pool = get_pool()
+    if pool is not None:
+        stats["bg_removal_pool"] = pool.stats()
+    return stats
+
+
+# With EAGER_LOAD the models are loaded and warmed at startup and /ready turns green afterwards
+readiness = Readiness(required=eager_load_enabled())
+
+
+async def _start_up() -> None:
+    """Load both models in parallel on their lanes, then run the warmup generations."""
+
+    async def load(step: str, lane: ExecutorLane, fn) -> None:
+        with readiness.step(step):
+            await lane.run(fn)
+
+    try:
+        readiness.set_state("loading")
+        # On the lanes, so requests arriving early queue behind the load instead of loading again
+        await asyncio.gather(
+            load("pipeline_load", generation_lane, load_pipeline),
+            load("rembg_load", bg_removal_lane, warm_background_removal),
+        )
+        readiness.set_state("warming")
+        for height, width in warmup_resolutions():
+            with readiness.step(f"warmup_{width}x{height}"):
+                await generation_lane.run(warm_generation, height, width, warmup_steps())
+        readiness.mark_ready()
+    except Exception as exc:  # noqa: BLE001
+        readiness.fail(exc)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the generation batcher (and eager startup); stop them, the executor lanes and the rembg workers on shutdown."""
+    await batcher.start()
+    startup = asyncio.create_task(_start_up(), name="startup") if readiness.required else None
+    try:
+        yield
+    finally:
+        if startup is not None:
+            startup.cancel()
+            await asyncio.gather(startup, return_exceptions=True)
+        await batcher.stop()
+        await asyncio.to_thread(generation_lane.shutdown)
+        await asyncio.to_thread(bg_removal_lane.shutdown)
+        pool = get_pool()
+        if pool is not None:
+            await asyncio.to_thread(pool.shutdown)
+
+
+app = FastAPI(title="OOTD Inference Service", version="0.1.0", lifespan=lifespan)
+
+
+async def _run_request(request: InferenceRequest, allow_binary: bool = True) -> Union[InferenceResponse, Response]:
+    # Profiling is opt-in per request; without it no profiler object is ever created
+    profiler = InferenceProfiler(request.task_id) if request.profile else None
+    try:
+        if request.response_mode == "file" and not request.output_path:
+            raise ValueError("output_path is required when response_mode is 'file'")
+
+        encode_options = resolve_options(
+            output_format=request.output_format,
+            quality=request.output_quality,
+            png_compress_level=request.png_compress_level,
+            webp_lossless=request.webp_lossless,
+        )
+
+        image_digests = None
+        if batcher.max_batch_size > 1 and profiler is None:
+            # Same images under different paths (each API task has its own cutouts) may still batch
+            image_digests = tuple(await asyncio.to_thread(content_digests, request.image_paths))
+
+        # Concurrent compatible requests are generated together in one pipeline call
+        image = await batcher.submit(
+            GenerationJob(
+                prompt=request.prompt,
+                image_paths=request.image_paths,
+                height=request.height,
+                width=request.width,
+                guidance_scale=request.guidance_scale,
+                num_inference_steps=request.num_inference_steps,
+                seed=request.seed,
+                image_digests=image_digests,
+                profiler=profiler,
+            )
+        )
+        profile = profiler.summary if profiler is not None else None
+        # Encoding is CPU-bound; keep it off the event loop
+        with stage_timer("encode_image"):
+            image_bytes = await asyncio.to_thread(encode_image, image, encode_options)
+
+        if request.response_mode == "file":
+            output_path = request.output_path
+            if not os.path.splitext(output_path)[1]:
+                output_path = f"{output_path}.{encode_options.extension}"
+            with stage_timer("write_file"):
+                output_path = await asyncio.to_thread(write_image_file, image_bytes, output_path)
+            return InferenceResponse(
+                success=True,
+                output_path=output_path,
+                image_format=encode_options.format,
+                profile=profile,
+                error_message=None,
+            )
+        if request.response_mode == "binary" and allow_binary:
+            headers = {"X-Image-Width": str(image.width), "X-Image-Height": str(image.height)}
+            if profile is not None:
+                headers["X-Profile-Dir"] = profile["output_dir"]
+            return Response(content=image_bytes, media_type=encode_options.media_type, headers=headers)
+        with stage_timer("base64"):
+            image_base64 = await asyncio.to_thread(lambda: base64.b64encode(image_bytes).decode("utf-8"))
+        return InferenceResponse(
+            success=True,
+            image_base64=image_base64,
+            image_format=encode_options.format,
+            profile=profile,
+            error_message=None,
+        )
+    except Exception as exc:  # noqa: BLE001
+        return InferenceResponse(
+            success=False,
+            image_base64=None,
+            profile=profiler.summary if profiler is not None and profiler.summary else None,
+            error_message=str(exc),
+        )
 
 
 @app.post("/infer", response_model=InferenceResponse)
-async def infer(request: InferenceRequest) -> InferenceResponse:
+async def infer(
+    request: InferenceRequest,
+    x_profile: Optional[str] = Header(default=None),
+) -> Union[InferenceResponse, Response]:
     """
     Run inference with the given prompt and images.
 
     This is a pure inference service - no business logic, just model inference.
+    With response_mode 'binary' a successful result is the encoded image as the response
+    body (format in Content-Type, size in X-Image-Width / X-Image-Height); failures are always JSON.
+    Setting the request's profile field or an X-Profile: 1 header stores a profile of the
+    generation under PROFILE_DIR/<task_id> (X-Profile-Dir header in binary mode).
     """
-    try:
-        image_base64 = run_inference(
-            prompt=request.prompt,
-            image_paths=request.image_paths,
-            height=request.height,
-            width=request.width,
-            guidance_scale=request.guidance_scale,
-            num_inference_steps=request.num_inference_steps,
-        )
-        return InferenceResponse(success=True, image_base64=image_base64, error_message=None)
-    except Exception as exc:  # noqa: BLE001
-        return InferenceResponse(success=False, image_base64=None, error_message=str(exc))
+    if x_profile is not None and x_profile.strip().lower() in ("1", "true", "yes", "on"):
+        request = request.copy(update={"profile": True})
+    with IN_PROGRESS.labels("infer").track_inprogress():
+        return await _run_request(request)
+
+
+@app.post("/infer_batch", response_model=InferenceBatchResponse)
+async def infer_batch(request: InferenceBatchRequest) -> InferenceBatchResponse:
+    """
+    Run several inference requests on the warm model.
+
+    Items go through the same batcher as /infer, so compatible items share pipeline calls.
+    Results are returned in request order; a failing item does not fail the others.
+    """
+    with IN_PROGRESS.labels("infer_batch").track_inprogress():
+        results = await asyncio.gather(*(_run_request(item, allow_binary=False) for item in request.items))
+        return InferenceBatchResponse(results=list(results))
 
 
 @app.post("/remove_background", response_model=BackgroundRemovalResponse)
@@ -43,18 +252,50 @@ async def remove_bg(request: BackgroundRemovalRequest) -> BackgroundRemovalRespo
     This is an optional standalone service. The remover can also be used as a library.
     """
     try:
-        output_path = remove_background(
-            image_path_or_url=request.image_path,
-            output_path=request.output_path,
-        )
+        with IN_PROGRESS.labels("remove_background").track_inprogress():
+            output_path = await bg_removal_lane.run(remove_background, request.image_path, request.output_path)
         return BackgroundRemovalResponse(success=True, output_path=output_path, error_message=None)
     except Exception as exc:  # noqa: BLE001
         return BackgroundRemovalResponse(success=False, output_path=None, error_message=str(exc))
 
 
+def _remove_background_item(item: BackgroundRemovalItem, return_base64: bool) -> BackgroundRemovalResponse:
+    """Process one batch item (on the bg_removal lane); errors become the item's result."""
+    try:
+        if item.image_base64:
+            output_path = remove_background_bytes(base64.b64decode(item.image_base64), item.output_path)
+        elif item.image_path:
+            output_path = remove_background(item.image_path, item.output_path)
+        else:
+            raise ValueError("Either image_path or image_base64 is required")
+        image_base64 = None
+        if return_base64:
+            with open(output_path, "rb") as f:
+                image_base64 = base64.b64encode(f.read()).decode("utf-8")
+        return BackgroundRemovalResponse(success=True, output_path=output_path, image_base64=image_base64)
+    except Exception as exc:  # noqa: BLE001
+        return BackgroundRemovalResponse(success=False, output_path=None, error_message=str(exc))
+
+
+@app.post("/remove_background_batch", response_model=BackgroundRemovalBatchResponse)
+async def remove_bg_batch(request: BackgroundRemovalBatchRequest) -> BackgroundRemovalBatchResponse:
+    """
+    Remove the background of several images (paths, URLs or inline base64) in one call.
+
+    Items run concurrently on the bg_removal lane, so they spread over the rembg
+    workers; identical images are computed once via the result cache. Results are
+    returned in request order; a failing item does not fail the others.
+    """
+    with IN_PROGRESS.labels("remove_background_batch").track_inprogress():
+        results = await asyncio.gather(
+            *(bg_removal_lane.run(_remove_background_item, item, request.return_base64) for item in request.items)
+        )
+    return BackgroundRemovalBatchResponse(results=list(results))
+
+
 @app.get("/health")
 async def health() -> dict:
-    """Health check endpoint for unified inference service."""
+    """Health check endpoint for unified inference service (answered by the event loop, never blocked by model work)."""
     return {
         "status": "ok",
         "service": "inference",
@@ -62,6 +303,47 @@ async def health() -> dict:
     }
 
 
+@app.get("/ready")
+async def ready() -> JSONResponse:
+    """
+    Readiness probe: 200 once the models are loaded and warm, 503 until then (or if startup failed).
+
+    Only gates anything with EAGER_LOAD; /health remains the liveness probe.
+    """
+    status = readiness.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/stats")
+async def stats() -> dict:
+    """Executor lane and batcher queue stats, and the prompt embedding, background-removal, input image, reference image and latent cache counters."""
+    return {
+        "startup": readiness.status(),
+        "queues": _queue_stats(),
+        "prompt_cache": get_prompt_cache().stats(),
+        "bg_cache": get_cache().stats(),
+        "image_cache": get_fetcher().stats(),
+        "reference_cache": get_reference_cache().stats(),
+        "latent_cache": get_latent_cache().stats(),
+    }
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """Prometheus exposition: per-stage latency histograms, model-load time, in-flight requests and cache gauges."""
+    body = render_metrics(
+        {
+            "prompt_cache": get_prompt_cache().stats(),
+            "bg_cache": get_cache().stats(),
+            "image_cache": get_fetcher().stats(),
+            "reference_cache": get_reference_cache().stats(),
+            "latent_cache": get_latent_cache().stats(),
+        },
+        queues=_queue_stats(),
+    )
+    return Response(content=body, media_type=CONTENT_TYPE_LATEST)
+
+
 if __name__ == "__main__":
     import uvicorn
 
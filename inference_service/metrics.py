@@ -0,0 +1,91 @@
+"""Prometheus metrics for the inference service: per-stage latency, model-load time and cache gauges."""
+
+from __future__ import annotations
+
+import functools
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_SECONDS = Histogram(
+    "ootd_inference_stage_seconds",
+    "Time spent in each inference / background-removal stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "ootd_inference_batch_size",
+    "Images generated per pipeline call",
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16),
+)
+MODEL_LOAD_SECONDS = Gauge("ootd_inference_model_load_seconds", "Time taken to load each model", ["model"])
+STARTUP_SECONDS = Gauge(
+    "ootd_inference_startup_seconds", "Time taken by each startup step (model loads, warmup generations)", ["step"]
+)
+READY = Gauge("ootd_inference_ready", "1 once the service is loaded and warm (see /ready)")
+IN_PROGRESS = Gauge("ootd_inference_requests_in_progress", "Requests currently being served", ["endpoint"])
+CACHE_STATS = Gauge("ootd_inference_cache_stats", "Snapshot of cache counters (entries, bytes, hits, misses)", ["cache", "field"])
+QUEUE_STATS = Gauge("ootd_inference_queue_stats", "Executor lane and batcher queue counters", ["queue", "field"])
+CACHE_HIT_RATIO = Gauge("ootd_inference_cache_hit_ratio", "Cache hits / lookups since start", ["cache"])
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Time the enclosed block as one observation of stage (also when it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def timed(stage: str) -> Callable[[F], F]:
+    """Decorator form of stage_timer."""
+
+    def decorator(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage_timer(stage):
+                return fn(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def render(caches: Dict[str, Dict[str, int]], queues: Optional[Dict[str, Dict[str, float]]] = None) -> bytes:
+    """Refresh the cache and queue gauges from stats() snapshots and return the exposition text."""
+    for queue, values in (queues or {}).items():
+        for field, value in values.items():
+            QUEUE_STATS.labels(queue, field).set(value)
+    for cache, values in caches.items():
+        for field, value in values.items():
+            CACHE_STATS.labels(cache, field).set(value)
+        lookups = values.get("hits", 0) + values.get("misses", 0)
+        if lookups:
+            CACHE_HIT_RATIO.labels(cache).set(values.get("hits", 0) / lookups)
+    return generate_latest()
+
+
+__all__ = [
+    "BATCH_SIZE",
+    "CONTENT_TYPE_LATEST",
+    "IN_PROGRESS",
+    "MODEL_LOAD_SECONDS",
+    "READY",
+    "STARTUP_SECONDS",
+    "observe_stage",
+    "render",
+    "stage_timer",
+    "timed",
+]
@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -21,12 +21,58 @@ class InferenceRequest(BaseModel):
     width: int = Field(default=1024, description="Output image width")
     guidance_scale: float = Field(default=1.0, description="Guidance scale for generation")
     num_inference_steps: int = Field(default=10, description="Number of inference steps")
+    seed: Optional[int] = Field(default=None, description="Optional random seed for reproducible generation")
+    response_mode: Literal["base64", "binary", "file"] = Field(
+        default="base64",
+        description="How the image is returned: base64 in JSON, raw image bytes as the response body, "
+        "or written to output_path (shared volume or /dev/shm) with only the path in JSON.",
+    )
+    output_path: Optional[str] = Field(
+        default=None,
+        description="Where to write the image when response_mode is 'file'. "
+        "Without a file extension, the one matching output_format is appended.",
+    )
+    output_format: Optional[Literal["png", "webp", "jpeg"]] = Field(
+        default=None, description="Output encoding. If None, uses the OUTPUT_FORMAT deployment default."
+    )
+    output_quality: Optional[int] = Field(
+        default=None, ge=0, le=100, description="JPEG quality, or WebP quality when lossy"
+    )
+    png_compress_level: Optional[int] = Field(default=None, ge=0, le=9, description="PNG zlib compression level")
+    webp_lossless: Optional[bool] = Field(default=None, description="Encode WebP losslessly")
+    task_id: Optional[str] = Field(default=None, description="Caller's task id, used to name profiling artifacts")
+    profile: bool = Field(
+        default=False,
+        description="Capture cProfile, torch.profiler and peak-memory data for this request under PROFILE_DIR/<task_id>",
+    )
 
 
 class InferenceResponse(BaseModel):
     """Response model for inference service."""
 
     success: bool = Field(..., description="Whether inference succeeded")
-    image_base64: Optional[str] = Field(default=None, description="Base64-encoded generated image (PNG)")
+    image_base64: Optional[str] = Field(default=None, description="Base64-encoded generated image")
+    image_format: Optional[str] = Field(default=None, description="Encoding of the image (png, webp or jpeg)")
+    output_path: Optional[str] = Field(default=None, description="Path of the written image (response_mode 'file')")
+    profile: Optional[Dict[str, Any]] = Field(
+        default=None, description="Profiling summary (artifact directory, wall time, peak memory) if requested"
+    )
     error_message: Optional[str] = Field(default=None, description="Error message if inference failed")
 
+
+
+class InferenceBatchRequest(BaseModel):
+    """Request model for running several inference requests back-to-back."""
+
+    items: List[InferenceRequest] = Field(
+        ...,
+        description="Inference requests to run. Items asking for response_mode 'binary' get base64 instead.",
+        min_items=1,
+        max_items=16,
+    )
+
+
+class InferenceBatchResponse(BaseModel):
+    """Response model for batch inference; results are in request order."""
+
+    results: List[InferenceResponse] = Field(..., description="Per-item inference results")
@@ -0,0 +1,177 @@
+"""Reference-image preprocessing: reduced-resolution decode and an in-memory cache of the results."""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+from PIL import Image
+
+from fetch import get_fetcher
+from metrics import stage_timer
+
+# The pipeline scales reference images down to about this many pixels before encoding them
+DEFAULT_MAX_PIXELS = 1024 * 1024
+
+
+def target_size(size: Tuple[int, int], max_pixels: int) -> Tuple[int, int]:
+    """Size the pipeline will scale an image of size down to (unchanged if already small enough)."""
+    width, height = size
+    if width * height <= max_pixels:
+        return width, height
+    scale = math.sqrt(max_pixels / (width * height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def decode_reduced(data: bytes, max_pixels: int) -> Image.Image:
+    """
+    Decode an image as RGB at the smallest resolution that is still at least its target size.
+
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale by libjpeg (draft mode), which
+    skips most of the IDCT work and never allocates the full-size bitmap; any
+    remaining whole factor (and other formats) is removed with Image.reduce.
+    The pipeline does the final resize, so results match full decodes closely.
+    """
+    with Image.open(BytesIO(data)) as image:
+        target = target_size(image.size, max_pixels)
+        if image.format == "JPEG" and target != image.size:
+            image.draft("RGB", target)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        factor = min(image.size[0] // target[0], image.size[1] // target[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+        image.load()
+        return image
+
+
+class ReferenceImageCache:
+    """
+    Bounded LRU of preprocessed reference images keyed by content hash and target size.
+
+    Garment and model photos are reused across many tasks; a hit skips decoding
+    entirely. Cached images are shared between requests and must not be modified
+    in place (the pipeline only reads them).
+    """
+
+    def __init__(self, max_bytes: int | None = None) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Memory budget for decoded pixels; 0 disables caching. If None, reads REFERENCE_CACHE_MAX_BYTES.
+        """
+        if max_bytes is None:
+            max_bytes = int(os.getenv("REFERENCE_CACHE_MAX_BYTES", str(256 * 1024**2)))
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[Tuple[str, int], Image.Image]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get_or_decode(self, data: bytes, max_pixels: int, digest: str | None = None) -> Image.Image:
+        """Return the preprocessed image for data, decoding it on a miss (digest: sha256 of data, if known)."""
+        if not self.enabled:
+            with stage_timer("image_decode"):
+                return decode_reduced(data, max_pixels)
+
+        key = (digest or hashlib.sha256(data).hexdigest(), max_pixels)
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+
+        # Two threads missing the same image both decode it; the second insert just replaces the first
+        with stage_timer("image_decode"):
+            image = decode_reduced(data, max_pixels)
+        size = _nbytes(image)
+        if size > self.max_bytes:
+            return image
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= _nbytes(previous)
+            self._entries[key] = image
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= _nbytes(old)
+                self.evictions += 1
+        return image
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _nbytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+_REFERENCE_CACHE: ReferenceImageCache | None = None
+_REFERENCE_CACHE_LOCK = threading.Lock()
+
+
+def get_reference_cache() -> ReferenceImageCache:
+    """Get or create the preprocessed reference image cache (singleton pattern)."""
+    global _REFERENCE_CACHE
+    if _REFERENCE_CACHE is None:
+        with _REFERENCE_CACHE_LOCK:
+            if _REFERENCE_CACHE is None:
+                _REFERENCE_CACHE = ReferenceImageCache()
+    return _REFERENCE_CACHE
+
+
+def reference_max_pixels() -> int:
+    return int(os.getenv("REFERENCE_MAX_PIXELS", str(DEFAULT_MAX_PIXELS)))
+
+
+def content_digests(paths: List[str]) -> List[str]:
+    """sha256 hex digests of the images at paths (local or remote, read concurrently), in order."""
+    fetcher = get_fetcher()
+    return fetcher.map(lambda path: hashlib.sha256(fetcher.read_bytes(path)).hexdigest(), paths)
+
+
+def load_reference_image(path_or_url: str, max_pixels: int | None = None) -> Tuple[Image.Image, str]:
+    """
+    Load a reference image for the pipeline, preprocessed to about max_pixels.
+
+    Args:
+        path_or_url: Local path or URL (remote images go through the shared fetch cache).
+        max_pixels: Target pixel count. If None, reads REFERENCE_MAX_PIXELS.
+
+    Returns:
+        The RGB image (possibly shared with other requests) and the sha256 hex digest of its source bytes.
+    """
+    if max_pixels is None:
+        max_pixels = reference_max_pixels()
+    data = get_fetcher().read_bytes(path_or_url)
+    digest = hashlib.sha256(data).hexdigest()
+    return get_reference_cache().get_or_decode(data, max_pixels, digest), digest
@@ -0,0 +1,113 @@
+"""Opt-in per-request profiling: cProfile, torch.profiler trace and peak memory."""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Any, Dict, Optional
+
+import torch
+
+# cProfile, tracemalloc and the torch profiler are process-wide; profiled requests take turns
+_PROFILE_LOCK = threading.Lock()
+
+
+class InferenceProfiler:
+    """
+    Context manager capturing a profile of one generation.
+
+    On exit it writes, under PROFILE_DIR/<task_id>/:
+      - cprofile.pstats / cprofile.txt: Python profile (load with pstats or snakeviz)
+      - torch_trace.json: torch.profiler trace (open in chrome://tracing or Perfetto)
+      - summary.json: wall time and peak host / device memory, also available as .summary
+
+    Only created when a request asks for profiling; callers pass None otherwise,
+    so the disabled path costs nothing.
+    """
+
+    def __init__(self, task_id: str | None = None, profile_dir: str | None = None) -> None:
+        """
+        Initialize the profiler.
+
+        Args:
+            task_id: Names the artifact directory. If None, a random id is used.
+            profile_dir: Root directory for artifacts. If None, reads PROFILE_DIR.
+        """
+        root = profile_dir or os.getenv("PROFILE_DIR", os.path.join("outputs", "profiles"))
+        self.task_id = task_id or uuid.uuid4().hex
+        self.output_dir = os.path.join(root, self.task_id)
+        self.summary: Dict[str, Any] = {}
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._torch_profiler: Optional[torch.profiler.profile] = None
+        self._start = 0.0
+
+    def __enter__(self) -> "InferenceProfiler":
+        _PROFILE_LOCK.acquire()
+        try:
+            tracemalloc.start()
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+                torch.cuda.reset_peak_memory_stats()
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            torch_profiler = torch.profiler.profile(activities=activities, profile_memory=True)
+            torch_profiler.__enter__()
+            self._torch_profiler = torch_profiler
+            self._cprofile = cProfile.Profile()
+            self._start = time.perf_counter()
+            self._cprofile.enable()
+        except BaseException:
+            self._stop()
+            _PROFILE_LOCK.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            self._stop()
+        finally:
+            _PROFILE_LOCK.release()
+
+    def _stop(self) -> None:
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        wall_seconds = time.perf_counter() - self._start
+        if self._torch_profiler is not None:
+            self._torch_profiler.__exit__(None, None, None)
+        python_peak = 0
+        if tracemalloc.is_tracing():
+            _, python_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.summary = {
+            "task_id": self.task_id,
+            "output_dir": self.output_dir,
+            "wall_seconds": wall_seconds,
+            "python_peak_bytes": python_peak,
+            # ru_maxrss is the lifetime peak of the process, in KiB on Linux
+            "process_max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "device_peak_allocated_bytes": torch.cuda.max_memory_allocated() if torch.cuda.is_available() else None,
+            "device_peak_reserved_bytes": torch.cuda.max_memory_reserved() if torch.cuda.is_available() else None,
+        }
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(os.path.join(self.output_dir, "cprofile.pstats"))
+            text = io.StringIO()
+            pstats.Stats(self._cprofile, stream=text).sort_stats("cumulative").print_stats(50)
+            with open(os.path.join(self.output_dir, "cprofile.txt"), "w", encoding="utf-8") as f:
+                f.write(text.getvalue())
+        if self._torch_profiler is not None:
+            self._torch_profiler.export_chrome_trace(os.path.join(self.output_dir, "torch_trace.json"))
+        with open(os.path.join(self.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(self.summary, f, indent=2)
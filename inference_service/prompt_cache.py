@@ -0,0 +1,118 @@
+"""In-memory LRU cache of text-encoder outputs for repeated prompts."""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+
+class PromptEmbeddingCache:
+    """
+    Bounded LRU of prompt embeddings keyed by the exact prompt and the model revision.
+
+    The API builds prompts from a small set of templates, so most requests repeat
+    a prompt seen before; a hit skips the text encoder entirely. Embeddings are
+    kept on the inference device by default, or in host memory (and copied to the
+    device on use) when device memory is tight. Callers always get their own copy,
+    so a pipeline that modifies prompt_embeds in place cannot corrupt the cache.
+    """
+
+    def __init__(
+        self,
+        max_entries: int | None = None,
+        revision: str | None = None,
+        host_memory: bool | None = None,
+    ) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum cached prompts; 0 disables caching. If None, reads PROMPT_EMBED_CACHE_SIZE.
+            revision: Model / text-encoder revision, part of every key. If None, reads MODEL_REVISION.
+            host_memory: Keep embeddings in host memory instead of on the device.
+                If None, reads PROMPT_EMBED_CACHE_HOST.
+        """
+        if max_entries is None:
+            max_entries = int(os.getenv("PROMPT_EMBED_CACHE_SIZE", "256"))
+        self.max_entries = max_entries
+        self.revision = revision or os.getenv("MODEL_REVISION", "default")
+        if host_memory is None:
+            host_memory = os.getenv("PROMPT_EMBED_CACHE_HOST", "false").strip().lower() in ("1", "true", "yes", "on")
+        self.host_memory = host_memory
+
+        self._entries: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get_or_encode(self, prompt: str, encode: Callable[[], Any], device: str) -> Any:
+        """
+        Return the embedding tensor for prompt on device, running encode() on a miss.
+
+        Args:
+            prompt: The exact prompt string.
+            encode: Runs the text encoder and returns the prompt embedding tensor.
+            device: Device the pipeline runs on.
+
+        Returns:
+            The prompt embedding tensor, never the cached tensor itself.
+        """
+        key = (self.revision, prompt)
+        with self._lock:
+            embeds = self._entries.get(key)
+            if embeds is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if embeds is not None:
+            return _private_copy(embeds, device, embeds)
+
+        # Two threads missing the same prompt both encode it; the second insert just replaces the first
+        embeds = encode()
+        stored = embeds.to("cpu") if self.host_memory else embeds
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= _nbytes(previous)
+            self._entries[key] = stored
+            self._bytes += _nbytes(stored)
+            while len(self._entries) > self.max_entries:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= _nbytes(old)
+                self.evictions += 1
+        return _private_copy(embeds, device, stored)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _private_copy(embeds: Any, device: str, stored: Any) -> Any:
+    """Return embeds on device, cloned if that would otherwise hand out the cached tensor."""
+    result = embeds.to(device)
+    return result.clone() if result is stored else result
+
+
+def _nbytes(tensor: Any) -> int:
+    return tensor.element_size() * tensor.nelement()
@@ -0,0 +1,127 @@
+"""Eager model loading and warmup at startup, and the readiness state behind /ready."""
+
+from __future__ import annotations
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+from PIL import Image
+
+from bg_removal.remover import warm_up as warm_background_removal
+from infer import generate_image, load_pipeline
+from metrics import READY, STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+WARMUP_PROMPT = "A person wearing the garment from the reference image, full body, studio photo"
+
+
+def eager_load_enabled() -> bool:
+    """Whether to load and warm the models at startup (EAGER_LOAD) instead of on the first request."""
+    return os.getenv("EAGER_LOAD", "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+def warmup_resolutions() -> List[Tuple[int, int]]:
+    """(height, width) pairs from WARMUP_RESOLUTIONS, e.g. "1024x1024,768x1024" (WIDTHxHEIGHT); empty skips warmup."""
+    resolutions = []
+    for item in os.getenv("WARMUP_RESOLUTIONS", "1024x1024").split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        width, height = item.split("x")
+        resolutions.append((int(height), int(width)))
+    return resolutions
+
+
+def warmup_steps() -> int:
+    return int(os.getenv("WARMUP_STEPS", "2"))
+
+
+class Readiness:
+    """
+    Startup progress of the service: pending -> loading -> warming -> ready (or failed).
+
+    When eager loading is off the service is ready immediately and models load
+    on the first request, as before.
+    """
+
+    def __init__(self, required: bool) -> None:
+        self.required = required
+        self.state = "pending" if required else "ready"
+        self.error: str | None = None
+        self.durations: Dict[str, float] = {}
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        READY.set(0 if required else 1)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def set_state(self, state: str) -> None:
+        self.state = state
+        logger.info("Startup: %s", state)
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        """Time one startup step; its duration goes to the log, status() and ootd_inference_startup_seconds."""
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.durations[name] = seconds
+        STARTUP_SECONDS.labels(name).set(seconds)
+        logger.info("Startup step %s took %.1fs", name, seconds)
+
+    def mark_ready(self) -> None:
+        total = time.perf_counter() - self._started
+        with self._lock:
+            self.durations["total"] = total
+        STARTUP_SECONDS.labels("total").set(total)
+        self.state = "ready"
+        READY.set(1)
+        logger.info("Startup complete in %.1fs: %s", total, self._summary())
+
+    def fail(self, exc: BaseException) -> None:
+        self.state = "failed"
+        self.error = str(exc)
+        logger.error("Startup failed after %.1fs: %s", time.perf_counter() - self._started, exc)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            durations = {name: round(seconds, 3) for name, seconds in self.durations.items()}
+        return {"ready": self.ready, "state": self.state, "error": self.error, "durations": durations}
+
+    def _summary(self) -> str:
+        return ", ".join(f"{name}={seconds:.1f}s" for name, seconds in self.durations.items())
+
+
+def warm_generation(height: int, width: int, steps: int) -> None:
+    """Run one short generation at height x width so first-call kernel setup happens now."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reference = os.path.join(tmp_dir, "warmup.png")
+        Image.new("RGB", (width, height), (200, 200, 200)).save(reference)
+        generate_image(WARMUP_PROMPT, [reference], height=height, width=width, num_inference_steps=steps, seed=0)
+
+
+def run_startup(readiness: Readiness) -> None:
+    """Load the models and warm up, blocking (for the RunPod worker, before it takes jobs)."""
+    try:
+        readiness.set_state("loading")
+        with readiness.step("pipeline_load"):
+            load_pipeline()
+        with readiness.step("rembg_load"):
+            warm_background_removal()
+        readiness.set_state("warming")
+        for height, width in warmup_resolutions():
+            with readiness.step(f"warmup_{width}x{height}"):
+                warm_generation(height, width, warmup_steps())
+        readiness.mark_ready()
+    except Exception as exc:  # noqa: BLE001
+        readiness.fail(exc)
+        raise
@@ -1,56 +1,294 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import time
 import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
 
-from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
 from app.client import InferenceClient
+from app.dedup import TaskDeduplicator, compute_task_key
 from app.image_processor import process_images_for_inference
-from app.models import CreateOutfitTaskRequest, TaskStatusResponse
+from app.metrics import CONTENT_TYPE_LATEST, observe_stage, render as render_metrics, stage_timer
+from app.models import (
+    CreateOutfitBatchRequest,
+    CreateOutfitBatchResponse,
+    CreateOutfitTaskRequest,
+    TaskInfo,
+    TaskStatusResponse,
+)
 from app.prompts import build_prompt
-from app.store import InMemoryTaskStore, TaskManager
+from app.results import CACHE_CONTROL, ResultImageServer
+from app.store import FINISHED_STATUSES, TaskManager, create_task_store
+from app.task_queue import QueueFullError, TaskQueue
 
 
-app = FastAPI(title="OOTD Outfit Generator API", version="0.1.0")
+# Upper bound for the long-poll ?wait= parameter (seconds)
+MAX_LONG_POLL_WAIT = 60.0
+# Interval between keep-alive comments on an idle SSE stream (seconds)
+SSE_KEEPALIVE_INTERVAL = 15.0
 
-store = InMemoryTaskStore()
+store = create_task_store()
 manager = TaskManager(store)
 inference_client = InferenceClient()
+deduplicator = TaskDeduplicator()
+result_images = ResultImageServer()
 
 
 async def _process_task(task_id: str, req: CreateOutfitTaskRequest) -> None:
     """Process a task: remove background if needed, build prompt, call inference service, save result."""
+    task_start = time.perf_counter()
     try:
-        await manager.set_running(task_id)
+        # Claiming guards against two API workers picking up the same recovered task
+        if not await manager.claim_task(task_id):
+            return
 
         # Process images: remove background if needed (via HTTP call to inference service)
-        image_paths = await process_images_for_inference(req, task_id, inference_client)
+        bg_removal_timings: dict = {}
+        start = time.perf_counter()
+        image_paths = await process_images_for_inference(
+            req, task_id, inference_client, timings=bg_removal_timings
+        )
+        preprocess_seconds = time.perf_counter() - start
+        observe_stage("preprocess", preprocess_seconds)
 
         # Build prompt (business logic)
-        prompt = build_prompt(req)
+        with stage_timer("build_prompt"):
+            prompt = build_prompt(req)
 
         # Call inference service (pure inference, no business logic)
+        start = time.perf_counter()
         out_path = await inference_client.infer(
             prompt=prompt,
             image_paths=image_paths,
             task_id=task_id,
+            height=req.height,
+            width=req.width,
+            guidance_scale=req.guidance_scale,
+            num_inference_steps=req.num_inference_steps,
+            seed=req.seed,
+            output_format=req.output_format,
+            output_quality=req.output_quality,
+            profile=req.profile,
         )
+        inference_seconds = time.perf_counter() - start
+        observe_stage("inference", inference_seconds)
 
         await manager.set_succeeded(
             task_id,
-            result={
-                "image_path": out_path,
-                "prompt": prompt,
-            },
+            result=_build_result(
+                task_id, out_path, prompt, bg_removal_timings, preprocess_seconds, inference_seconds
+            ),
         )
+        observe_stage("task_total", time.perf_counter() - task_start)
     except Exception as exc:  # noqa: BLE001
         await manager.set_failed(task_id, error_message=str(exc))
+        observe_stage("task_total", time.perf_counter() - task_start)
+
+
+async def _process_batch(batch_id: str, task_ids: List[str], requests: List[CreateOutfitTaskRequest]) -> None:
+    """
+    Process a batch: remove the shared person background once, prepare every variant's
+    garments concurrently, then send all variants to the inference service in one call.
+    """
+    claimed: List[Tuple[str, CreateOutfitTaskRequest]] = []
+    try:
+        for task_id, req in zip(task_ids, requests):
+            if await manager.claim_task(task_id):
+                claimed.append((task_id, req))
+        if claimed:
+            await _run_batch(batch_id, claimed)
+    except Exception as exc:  # noqa: BLE001
+        # Never leave a claimed variant RUNNING because of an unexpected error
+        await _fail_unfinished([task_id for task_id, _ in claimed], str(exc))
+
+
+async def _fail_unfinished(task_ids: List[str], error_message: str) -> None:
+    """Mark every task that has not finished yet as FAILED."""
+    for task_id in task_ids:
+        try:
+            task = await manager.get_task(task_id)
+            if task is not None and task.status not in FINISHED_STATUSES:
+                await manager.set_failed(task_id, error_message=error_message)
+        except Exception:  # noqa: BLE001
+            continue
+
+
+async def _run_batch(batch_id: str, claimed: List[Tuple[str, CreateOutfitTaskRequest]]) -> None:
+    """Generate the claimed variants of a batch (see _process_batch)."""
+
+    # All variants share the person image, so its background is removed once for the batch
+    first_req = claimed[0][1]
+    person_path = first_req.person_image_path
+    person_seconds = None
+    if not first_req.person_bg_removed:
+        output_dir = os.path.join("outputs", "bg_removed", batch_id)
+        os.makedirs(output_dir, exist_ok=True)
+        start = time.perf_counter()
+        try:
+            person_path = await inference_client.remove_background(
+                image_path=first_req.person_image_path,
+                output_path=os.path.join(output_dir, "person.png"),
+            )
+        except Exception as exc:  # noqa: BLE001
+            for task_id, _ in claimed:
+                await manager.set_failed(task_id, error_message=str(exc))
+            return
+        person_seconds = time.perf_counter() - start
+        observe_stage("bg_removal", person_seconds)
+
+    async def _prepare(task_id: str, req: CreateOutfitTaskRequest):
+        variant_req = req.copy(update={"person_image_path": person_path, "person_bg_removed": True})
+        bg_removal_timings: dict = {}
+        start = time.perf_counter()
+        image_paths = await process_images_for_inference(
+            variant_req, task_id, inference_client, timings=bg_removal_timings
+        )
+        if person_seconds is not None:
+            bg_removal_timings["person"] = person_seconds
+        preprocess_seconds = time.perf_counter() - start
+        observe_stage("preprocess", preprocess_seconds)
+        with stage_timer("build_prompt"):
+            prompt = build_prompt(req)
+        return prompt, image_paths, bg_removal_timings, preprocess_seconds
+
+    prepared = await asyncio.gather(*(_prepare(task_id, req) for task_id, req in claimed), return_exceptions=True)
+    ready = []
+    for (task_id, req), outcome in zip(claimed, prepared):
+        if isinstance(outcome, BaseException):
+            await manager.set_failed(task_id, error_message=str(outcome))
+        else:
+            ready.append((task_id, req, *outcome))
+    if not ready:
+        return
+
+    start = time.perf_counter()
+    try:
+        outputs = await inference_client.infer_batch(
+            [
+                inference_client.build_infer_request(
+                    prompt=prompt,
+                    image_paths=image_paths,
+                    height=req.height,
+                    width=req.width,
+                    guidance_scale=req.guidance_scale,
+                    num_inference_steps=req.num_inference_steps,
+                    seed=req.seed,
+                    output_format=req.output_format,
+                    output_quality=req.output_quality,
+                    profile=req.profile,
+                )
+                for _, req, prompt, image_paths, _, _ in ready
+            ],
+            [task_id for task_id, *_ in ready],
+        )
+    except Exception as exc:  # noqa: BLE001
+        for task_id, *_ in ready:
+            await manager.set_failed(task_id, error_message=str(exc))
+        return
+    inference_seconds = time.perf_counter() - start
+    observe_stage("inference_batch", inference_seconds)
+
+    for (task_id, _, prompt, _, bg_removal_timings, preprocess_seconds), out in zip(ready, outputs):
+        if isinstance(out, Exception):
+            await manager.set_failed(task_id, error_message=str(out))
+            continue
+        result = _build_result(task_id, out, prompt, bg_removal_timings, preprocess_seconds, inference_seconds)
+        result["batch_id"] = batch_id
+        await manager.set_succeeded(task_id, result=result)
+
+
+def _build_result(
+    task_id: str,
+    image_path: str,
+    prompt: str,
+    bg_removal_timings: dict,
+    preprocess_seconds: float,
+    inference_seconds: float,
+) -> dict:
+    return {
+        "image_path": image_path,
+        "image_url": f"/api/v1/outfit/tasks/{task_id}/image",
+        "prompt": prompt,
+        "timings": {
+            "bg_removal": bg_removal_timings,
+            "preprocess": preprocess_seconds,
+            "inference": inference_seconds,
+        },
+    }
+
+
+task_queue = TaskQueue()
+
+
+async def _recover_pending_tasks() -> None:
+    """Re-queue tasks a durable store still has as PENDING, e.g. after a restart."""
+    for task in await manager.list_pending_tasks():
+        try:
+            task_queue.submit(_process_task, task.task_id, task.input)
+        except QueueFullError:
+            # The rest stay PENDING in the store and are picked up on the next start
+            break
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Open the task store (which also starts failing tasks a crashed worker left RUNNING) and the
+    inference connection pool, and start the task queue; tear down on shutdown.
+    """
+    await manager.start()
+    await inference_client.start()
+    await task_queue.start()
+    await _recover_pending_tasks()
+    try:
+        yield
+    finally:
+        await task_queue.stop()
+        await inference_client.aclose()
+        await manager.close()
+
+
+app = FastAPI(title="OOTD Outfit Generator API", version="0.1.0", lifespan=lifespan)
+
+
+def _queue_full_exception(retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Task queue is full, please retry later",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+async def _find_reusable_task(key: str) -> Optional[TaskStatusResponse]:
+    """Return the task registered under key, unless it failed or no longer exists."""
+    task_id = deduplicator.lookup(key)
+    if task_id is None:
+        return None
+    task = await manager.get_task(task_id)
+    if task is None:
+        if deduplicator.is_creating(task_id):
+            # A concurrent identical submission is still registering this task
+            deduplicator.record_hit()
+            return TaskStatusResponse(task_id=task_id, status="PENDING", result=None, error_message=None)
+        deduplicator.forget(key)
+        return None
+    if task.status == "FAILED":
+        # Let the client retry a failed outfit instead of pinning it to the failure
+        deduplicator.forget(key)
+        return None
+    deduplicator.record_hit()
+    return _to_response(task)
 
 
 @app.post("/api/v1/outfit/tasks", response_model=TaskStatusResponse)
 async def create_outfit_task(
     request: CreateOutfitTaskRequest,
-    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(default=None),
 ) -> TaskStatusResponse:
     # Pydantic validators already ensured image count constraints
     try:
@@ -59,25 +297,202 @@ async def create_outfit_task(
     except Exception as e:  # noqa: BLE001
         raise HTTPException(status_code=400, detail=str(e)) from e
 
+    # Identical submissions (same idempotency key, or same prompt, images, parameters and explicit seed)
+    # reuse the stored result or attach to the in-flight task instead of starting a new GPU job.
+    dedup_keys: List[str] = []
+    if idempotency_key:
+        dedup_keys.append(TaskDeduplicator.idempotency_key(idempotency_key))
+        reusable = await _find_reusable_task(dedup_keys[0])
+        if reusable is not None:
+            return reusable
+    content_key = None
+    try:
+        # A profiling request must actually run, so it never reuses an earlier result; without a
+        # seed every submission asks for a fresh random image, so only seeded requests are identical
+        if not request.profile and request.seed is not None:
+            content_key = TaskDeduplicator.content_key(await compute_task_key(request, build_prompt(request)))
+    except OSError:
+        # Unreadable local image: skip deduplication and let the task fail with a proper error
+        pass
+    if content_key is not None:
+        reusable = await _find_reusable_task(content_key)
+        if reusable is not None:
+            for key in dedup_keys:
+                deduplicator.remember(key, reusable.task_id)
+            return reusable
+        dedup_keys.append(content_key)
+
+    # Reject early so a full queue does not leave orphaned PENDING tasks behind
+    try:
+        task_queue.ensure_capacity()
+    except QueueFullError as exc:
+        raise _queue_full_exception(exc.retry_after) from exc
+
     task_id = uuid.uuid4().hex
-    await manager.create_task(task_id, request)
-    background_tasks.add_task(_process_task, task_id, request)
+    deduplicator.mark_creating(task_id)
+    for key in dedup_keys:
+        deduplicator.remember(key, task_id)
+    try:
+        await manager.create_task(task_id, request)
+    except Exception:
+        for key in dedup_keys:
+            deduplicator.forget(key)
+        raise
+    finally:
+        deduplicator.mark_created(task_id)
+    try:
+        task_queue.submit(_process_task, task_id, request)
+    except QueueFullError as exc:
+        await manager.set_failed(task_id, error_message="Rejected: task queue is full")
+        raise _queue_full_exception(exc.retry_after) from exc
     return TaskStatusResponse(task_id=task_id, status="PENDING", result=None, error_message=None)
 
 
-@app.get("/api/v1/outfit/tasks/{task_id}", response_model=TaskStatusResponse)
-async def get_outfit_task(task_id: str) -> TaskStatusResponse:
-    task = await manager.get_task(task_id)
-    if task is None:
-        raise HTTPException(status_code=404, detail="Task not found")
+@app.post("/api/v1/outfit/batches", response_model=CreateOutfitBatchResponse)
+async def create_outfit_batch(request: CreateOutfitBatchRequest) -> CreateOutfitBatchResponse:
+    """
+    Generate several outfit variants for one person.
+
+    The person background is removed once for the whole batch and the variants are
+    sent to the inference service together. Each variant is tracked as a regular task.
+    """
+    try:
+        task_requests = request.to_task_requests()
+    except Exception as e:  # noqa: BLE001
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    # The whole batch occupies one queue slot
+    try:
+        task_queue.ensure_capacity()
+    except QueueFullError as exc:
+        raise _queue_full_exception(exc.retry_after) from exc
+
+    batch_id = uuid.uuid4().hex
+    task_ids = [uuid.uuid4().hex for _ in task_requests]
+    for task_id, task_request in zip(task_ids, task_requests):
+        await manager.create_task(task_id, task_request)
+    try:
+        task_queue.submit(_process_batch, batch_id, task_ids, task_requests)
+    except QueueFullError as exc:
+        for task_id in task_ids:
+            await manager.set_failed(task_id, error_message="Rejected: task queue is full")
+        raise _queue_full_exception(exc.retry_after) from exc
+    return CreateOutfitBatchResponse(batch_id=batch_id, task_ids=task_ids, status="PENDING")
+
+
+def _to_response(task: TaskInfo) -> TaskStatusResponse:
     return TaskStatusResponse(
         task_id=task.task_id,
-        status=task.status, 
+        status=task.status,
         result=task.result,
         error_message=task.error_message,
     )
 
 
+@app.get("/api/v1/outfit/tasks/{task_id}", response_model=TaskStatusResponse)
+async def get_outfit_task(
+    task_id: str,
+    wait: float = Query(default=0, ge=0, le=MAX_LONG_POLL_WAIT, description="Long-poll: seconds to wait for a status change"),
+) -> TaskStatusResponse:
+    task = await manager.get_task(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if wait > 0 and task.status not in FINISHED_STATUSES:
+        task = await manager.wait_for_change(task_id, task.status, timeout=wait)
+        if task is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+    return _to_response(task)
+
+
+@app.get("/api/v1/outfit/tasks/{task_id}/events")
+async def stream_outfit_task_events(task_id: str) -> StreamingResponse:
+    """Server-Sent Events stream of status transitions, ending after SUCCEEDED or FAILED."""
+    task = await manager.get_task(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def events() -> AsyncIterator[str]:
+        current: Optional[TaskInfo] = task
+        last_status = None
+        while current is not None:
+            if current.status != last_status:
+                last_status = current.status
+                yield f"event: status\ndata: {_to_response(current).json()}\n\n"
+                if current.status in FINISHED_STATUSES:
+                    return
+            else:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+            current = await manager.wait_for_change(task_id, last_status, timeout=SSE_KEEPALIVE_INTERVAL)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/v1/outfit/tasks/{task_id}/image")
+async def get_outfit_task_image(
+    task_id: str,
+    request: Request,
+    size: Optional[int] = Query(default=None, description="Serve a derivative whose longest side is at most size px"),
+) -> Response:
+    """
+    Serve a task's generated image, or a size-bucketed derivative of it.
+
+    Responses carry a strong content-hash ETag and immutable cache headers,
+    support conditional (If-None-Match) and range requests, and are sent with
+    the server's zero-copy file transfer where the ASGI server supports it.
+    """
+    task = await manager.get_task(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    image_path = (task.result or {}).get("image_path")
+    if task.status != "SUCCEEDED" or not image_path:
+        raise HTTPException(status_code=404, detail="Task has no result image")
+
+    path = image_path
+    if size is not None:
+        try:
+            path = await result_images.derivative(image_path, size)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail="Result image not found") from e
+
+    try:
+        stat_result = await asyncio.to_thread(os.stat, path)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail="Result image not found") from e
+
+    etag = await result_images.etag(path, stat_result)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(
+        path,
+        media_type=result_images.media_type(path),
+        headers=headers,
+        stat_result=stat_result,
+    )
+
+
+@app.get("/api/v1/stats")
+async def get_stats() -> dict:
+    """Queue depth, in-flight counters, task store size and evictions, and deduplication hits."""
+    return {"queue": task_queue.stats(), "store": await manager.stats(), "dedup": deduplicator.stats()}
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """Prometheus exposition: per-stage latency histograms, task outcomes and queue/store/dedup gauges."""
+    body = render_metrics(
+        {"queue": task_queue.stats(), "store": await manager.stats(), "dedup": deduplicator.stats()}
+    )
+    return Response(content=body, media_type=CONTENT_TYPE_LATEST)
+
+
 __all__ = ["app"]
 
 